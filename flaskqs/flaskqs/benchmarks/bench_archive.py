@@ -0,0 +1,119 @@
+"""Database size and page cache misses of hot reads, before and after
+archiving the bodies of old posts with ``flask archive-posts``.
+
+    python benchmarks/bench_archive.py --posts 1000000 --older-than 30
+
+The hot workload reads index pages and recent posts through a small
+SQLite page cache (DB_CACHE_SIZE) with mmap off, so every cache miss is
+a read() of the database file; misses are counted from /proc/self/io
+and are only reported on Linux.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import make_app, seed_database, temp_database
+from flaskr.archive import archive_posts, database_size
+from flaskr.db import get_pool, get_write_db
+
+
+def read_syscalls():
+    try:
+        with open('/proc/self/io') as f:
+            return int(dict(line.split(': ') for line in f)['syscr'])
+    except OSError:
+        return None
+
+
+def workload(app, hot_ids, requests, rng):
+    client = app.test_client()
+    paths = ['/', '/api/posts'] + [
+        f'/api/posts/{rng.choice(hot_ids)}' for _ in range(requests - 2)
+    ]
+    reads = read_syscalls()
+    start = time.perf_counter()
+
+    for path in paths:
+        client.get(path)
+
+    elapsed = time.perf_counter() - start
+    if reads is not None:
+        reads = (read_syscalls() - reads) / len(paths)
+    return len(paths) / elapsed, reads
+
+
+def sizes(db):
+    size, free = database_size(db)
+    try:
+        post = db.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'post'"
+        ).fetchone()[0]
+    except Exception:
+        # dbstat is an optional part of SQLite
+        post = None
+    return size, free, post
+
+
+def report(label, sizes, rate, reads):
+    size, free, post = sizes
+    mib = 2 ** 20
+    line = f'{label:>8}: database {size / mib:.1f} MiB'
+    line += f' ({free / mib:.1f} free)'
+    if post is not None:
+        line += f', post table {post / mib:.1f} MiB'
+    line += f', {rate:.0f} req/s'
+    if reads is not None:
+        line += f', {reads:.1f} page reads/request'
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--older-than', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--cache-kib', type=int, default=2000,
+                        help='SQLite page cache per connection.')
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        seed_database(path, users=100, posts=args.posts)
+        app = make_app(
+            path, DB_CACHE_SIZE=-args.cache_kib, DB_MMAP_SIZE=0,
+            PAGE_CACHE_BYTES=0, ROW_CACHE_SIZE=0,
+        )
+        now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        cutoff = now - timedelta(days=args.older_than)
+
+        with app.app_context():
+            hot_ids = [row[0] for row in get_write_db().execute(
+                'SELECT id FROM post WHERE created >= ?',
+                (cutoff.isoformat(' '),)
+            )]
+
+        for label in ('before', 'after'):
+            if label == 'after':
+                with app.app_context():
+                    start = time.perf_counter()
+                    count = archive_posts(cutoff)
+                    db = get_write_db()
+                    db.execute('VACUUM')
+                    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                    print(f'archived {count} posts and vacuumed in'
+                          f' {time.perf_counter() - start:.1f}s')
+
+            with app.app_context():
+                # start from cold connections (and page caches) each time
+                for role in ('read', 'write'):
+                    get_pool(role).close()
+
+            rate, reads = workload(
+                app, hot_ids, args.requests, random.Random(0)
+            )
+            with app.app_context():
+                report(label, sizes(get_write_db()), rate, reads)
+
+
+if __name__ == '__main__':
+    main()
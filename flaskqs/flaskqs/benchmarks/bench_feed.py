@@ -0,0 +1,168 @@
+"""Latency of reading a feed page and of posting to 100k followers, with
+the author's posts fanned out on write (in the request or by ``flask
+worker``) vs merged in on read, and of reading the page with the JOIN of
+follow and post instead.
+
+    python benchmarks/bench_feed.py --followers 100000 --follows 200
+
+Every user follows user1; the first ``--readers`` of them also follow
+``--follows`` of the other authors, each with ``--posts`` posts, and
+read their feeds page by page (``get_feed_page``, without rendering).
+user1 posts ``--writes`` times through ``/create`` in each mode before
+the feeds are read; with the fan-out left to the worker, it then drains
+the queue (``worker_seconds``).
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import make_app, seed_database, summarize
+from flaskr.blog import get_feed_page
+from flaskr.jobs import Worker
+
+FAST_HASH = 'pbkdf2:sha256:1000'
+
+JOIN_QUERY = (
+    'SELECT p.id, p.title, p.created, p.author_id FROM post p'
+    ' JOIN follow f ON f.author_id = p.author_id WHERE f.follower_id = ?'
+    ' ORDER BY p.created DESC, p.id DESC LIMIT ?'
+)
+
+
+def setup(path, args):
+    seed_database(path, users=args.followers + args.authors,
+                  PASSWORD_HASH_METHOD=FAST_HASH)
+    rng = random.Random(0)
+    start = datetime.now() - timedelta(days=365)
+    readers = range(args.authors + 1, args.authors + 1 + args.readers)
+
+    db = sqlite3.connect(path)
+    db.executemany(
+        'INSERT INTO post (author_id, created, title, body, body_html)'
+        " VALUES (?, ?, ?, 'Benchmark.', '<p>Benchmark.</p>')",
+        ((author, start + timedelta(minutes=rng.randrange(525600)),
+          f'{author}-{n}')
+         for author in range(2, args.authors + 1)
+         for n in range(args.posts))
+    )
+    db.execute(
+        'INSERT INTO follow (follower_id, author_id)'
+        ' SELECT id, 1 FROM user WHERE id > ?', (args.authors,)
+    )
+    db.commit()
+    db.close()
+
+    # the readers follow through the app, which fills in their feeds
+    app = make_app(path, PASSWORD_HASH_METHOD=FAST_HASH, RENDER_WORKERS=0)
+    for reader in readers:
+        client = app.test_client()
+        client.post('/auth/login',
+                    data={'username': f'user{reader}', 'password': 'password'})
+        for author in rng.sample(range(2, args.authors + 1), args.follows):
+            client.post(f'/user/user{author}/follow')
+
+    return readers
+
+
+def copy(source, target):
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def run(path, readers, fanout_limit, args, jobs=False):
+    app = make_app(path, PASSWORD_HASH_METHOD=FAST_HASH, RENDER_WORKERS=0,
+                   FEED_FANOUT_LIMIT=fanout_limit, FEED_FANOUT_JOBS=jobs)
+    result = {}
+
+    author = app.test_client()
+    author.post('/auth/login',
+                data={'username': 'user1', 'password': 'password'})
+    latencies = []
+    start = time.perf_counter()
+    for n in range(args.writes):
+        begin = time.perf_counter()
+        author.post('/create', data={'title': f'1-{n}', 'body': 'Hello.'})
+        latencies.append(time.perf_counter() - begin)
+    result['writes'] = summarize(latencies, time.perf_counter() - start)
+
+    if jobs:
+        start = time.perf_counter()
+        Worker(app, workers=1).run(once=True)
+        result['worker_seconds'] = time.perf_counter() - start
+
+    latencies = []
+    start = time.perf_counter()
+    with app.test_request_context():
+        for reader in readers:
+            before = None
+            for _ in range(args.pages):
+                begin = time.perf_counter()
+                page = get_feed_page(reader, before)
+                list(page)
+                latencies.append(time.perf_counter() - begin)
+                before = page.next_cursor
+                if before is None:
+                    break
+    result['reads'] = summarize(latencies, time.perf_counter() - start)
+
+    return result
+
+
+def join_reads(path, readers, per_page):
+    # first pages only: each is as slow as the whole feed is long
+    db = sqlite3.connect(path)
+    latencies = []
+    start = time.perf_counter()
+
+    for reader in readers:
+        begin = time.perf_counter()
+        db.execute(JOIN_QUERY, (reader, per_page + 1)).fetchall()
+        latencies.append(time.perf_counter() - begin)
+
+    db.close()
+    return {'reads': summarize(latencies, time.perf_counter() - start)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--followers', type=int, default=100000)
+    parser.add_argument('--authors', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=100,
+                        help='posts by each author but user1')
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--follows', type=int, default=200,
+                        help='authors each reader follows besides user1')
+    parser.add_argument('--writes', type=int, default=5,
+                        help='posts by user1 in each mode')
+    parser.add_argument('--pages', type=int, default=3,
+                        help='feed pages each reader reads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        seeded = os.path.join(folder, 'seeded.sqlite')
+        readers = setup(seeded, args)
+        results = {}
+
+        for n, (label, fanout_limit, jobs) in enumerate((
+            ('fan-out on write', args.followers + 1, False),
+            ('fan-out on write, by the worker', args.followers + 1, True),
+            ('fan-out on read', args.followers - 1, False),
+        )):
+            path = os.path.join(folder, f'{n}.sqlite')
+            copy(seeded, path)
+            results[label] = run(path, readers, fanout_limit, args, jobs)
+
+        results['join on read'] = join_reads(path, readers, 20)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare post writes/s under many concurrent authors, with one commit per
+request versus the group-commit writer.
+
+    python benchmarks/bench_group_commit.py --authors 50 --posts 20
+"""
+import argparse
+import json
+import threading
+import time
+
+from common import make_app, seed_database, summarize, temp_database
+from flaskr.writer import get_writer
+
+FAST_HASH = 'pbkdf2:sha256:1000'
+
+
+def run(path, group_commit, authors, posts):
+    app = make_app(
+        path, GROUP_COMMIT=group_commit, DB_POOL_SIZE=authors,
+        PASSWORD_HASH_METHOD=FAST_HASH,
+    )
+    latencies = []
+    errors = [0]
+    ready = threading.Barrier(authors + 1)
+
+    def author(n):
+        client = app.test_client()
+        client.post('/auth/login',
+                    data={'username': f'user{n}', 'password': 'password'})
+        ready.wait()
+        for i in range(posts):
+            start = time.perf_counter()
+            response = client.post(
+                '/create', data={'title': f'{n}-{i}', 'body': 'Benchmark.'}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 302:
+                errors[0] += 1
+
+    threads = [
+        threading.Thread(target=author, args=(n,))
+        for n in range(1, authors + 1)
+    ]
+    for t in threads:
+        t.start()
+    ready.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed, errors[0])
+    if group_commit:
+        with app.app_context():
+            writer = get_writer()
+            result['commits'] = writer.batches
+            writer.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--authors', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=20,
+                        help='posts written by each author')
+    args = parser.parse_args()
+
+    results = {}
+    for label, group_commit in (('per_request', False), ('group', True)):
+        with temp_database() as path:
+            seed_database(path, users=args.authors,
+                          PASSWORD_HASH_METHOD=FAST_HASH)
+            results[label] = run(path, group_commit, args.authors, args.posts)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Measure latency of / while a storm of logins hashes passwords.
+
+Runs the app on a threaded werkzeug server, once with hashing inline on
+the request threads (HASH_WORKERS=0), once with the hashing pool and once
+with the pool behind the default auth rate limits, which turn most of
+the storm away with a 429 before it hashes anything.
+
+    python benchmarks/bench_login_storm.py --storm 32 --seconds 10
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from common import (
+    HTTPClient, make_app, seed_database, serve, summarize, temp_database
+)
+from flaskr.hashing import get_hashing_pool
+
+# AUTH_RATE_LIMIT_IP and AUTH_RATE_LIMIT_USERNAME as create_app sets them
+DEFAULT_LIMITS = ((20, 1.0), (10, 6.0))
+
+
+def run(path, workers, storm, seconds, limits=(None, None)):
+    app = make_app(path, HASH_WORKERS=workers, HASH_MAX_PENDING=256,
+                   AUTH_RATE_LIMIT_IP=limits[0],
+                   AUTH_RATE_LIMIT_USERNAME=limits[1])
+    stop = time.monotonic() + seconds
+    index_times = []
+    logins = [0, 0]
+
+    with serve(app) as port:
+        def login():
+            client = HTTPClient(port)
+            while time.monotonic() < stop:
+                response = client.post(
+                    '/auth/login',
+                    data={'username': 'user1', 'password': 'password'}
+                )
+                logins[response.status in (429, 503)] += 1
+
+        def read_index():
+            client = HTTPClient(port)
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                client.get('/')
+                index_times.append(time.perf_counter() - start)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=login) for _ in range(storm)]
+        threads.append(threading.Thread(target=read_index))
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        get_hashing_pool().shutdown()
+
+    result = summarize(index_times, elapsed)
+    result['logins'], result['rejected_logins'] = logins
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--storm', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        seed_database(path, users=1, posts=100)
+        results = {
+            label: run(path, workers, args.storm, args.seconds, *limits)
+            for label, workers, *limits in (
+                ('inline', 0),
+                ('pool', args.workers),
+                ('pool, rate-limited', args.workers, DEFAULT_LIMITS),
+            )
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
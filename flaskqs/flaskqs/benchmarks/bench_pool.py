@@ -0,0 +1,57 @@
+"""Compare per-request connection setup with and without the pool.
+
+Each iteration does what a request does: push an app context, borrow a
+connection with get_db(), run a query and tear the context down again.
+
+    python benchmarks/bench_pool.py --requests 5000 --threads 8
+"""
+import argparse
+import threading
+import time
+
+from common import make_app, seed_database, temp_database
+from flaskr.db import get_db, get_pool
+
+
+def run(app, requests, threads):
+    per_thread = requests // threads
+
+    def worker():
+        for _ in range(per_thread):
+            with app.app_context():
+                get_db().execute(
+                    'SELECT id, username FROM user WHERE id = ?', (1,)
+                ).fetchone()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        seed_database(path, users=1)
+
+        for label, size in (('no pool', 0), ('pooled', args.pool_size)):
+            app = make_app(path, DB_POOL_SIZE=size)
+            rate = run(app, args.requests, args.threads)
+            with app.app_context():
+                pool = get_pool()
+                opened = pool.opened
+                pool.close()
+            print(f'{label:>8}: {rate:10.0f} req/s ({opened} connections opened)')
+
+
+if __name__ == '__main__':
+    main()
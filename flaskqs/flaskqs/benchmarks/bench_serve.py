@@ -0,0 +1,132 @@
+"""Throughput of ``flask serve`` against the werkzeug development server,
+single-threaded and threaded.
+
+    python benchmarks/bench_serve.py --clients 32 --workers 4 --threads 4
+
+The load comes from ``--clients`` client processes, each making one
+request per connection for ``--duration`` seconds, so the clients don't
+share a GIL with each other or with the server they measure.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from common import QuietHandler, make_app, seed_database, temp_database
+from flaskr.serve import Master
+
+PATHS = ['/', '/api/posts', '/api/posts/1', '/auth/login']
+
+
+def client(port, duration, results):
+    count, errors = 0, 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request('GET', PATHS[count % len(PATHS)])
+            if conn.getresponse().read() is not None:
+                count += 1
+        except OSError:
+            errors += 1
+        finally:
+            conn.close()
+
+    results.put((count, errors))
+
+
+def load(port, clients, duration):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=client, args=(port, duration, results))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    counts = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    return (sum(c for c, _ in counts) / duration,
+            sum(e for _, e in counts))
+
+
+def serve_dev(path, threaded):
+    server = make_server(
+        '127.0.0.1', 0, make_app(path), threaded=threaded,
+        request_handler=QuietHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+    return server.server_port, stop
+
+
+def serve_prefork(path, workers, threads):
+    master = Master(
+        make_app(path), lambda: make_app(path), '127.0.0.1', 0,
+        workers, threads, max_requests=0, max_requests_jitter=0,
+        graceful_timeout=5, quiet=True,
+    )
+    pid = os.fork()
+
+    if not pid:
+        status = 0
+        try:
+            master.run()
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    port = master.port
+    master.sock.close()
+    time.sleep(1)
+
+    def stop():
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    return port, stop
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=1000)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        seed_database(path, users=10, posts=args.posts)
+
+        runs = [
+            ('dev', lambda: serve_dev(path, threaded=False)),
+            ('dev threaded', lambda: serve_dev(path, threaded=True)),
+            (f'serve {args.workers}x{args.threads}',
+             lambda: serve_prefork(path, args.workers, args.threads)),
+        ]
+        for label, start in runs:
+            port, stop = start()
+            try:
+                rate, errors = load(port, args.clients, args.duration)
+            finally:
+                stop()
+            print(f'{label:>14}: {rate:.0f} req/s, {errors} errors')
+
+
+if __name__ == '__main__':
+    main()
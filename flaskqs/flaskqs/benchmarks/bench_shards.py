@@ -0,0 +1,114 @@
+"""Post writes/s from many concurrent authors and index reads/s, with the
+posts in the primary database and split over 1, 4 and 8 shards.
+
+    python benchmarks/bench_shards.py --authors 32 --seed-posts 20000
+    python benchmarks/bench_shards.py --group-commit
+
+Writers post through ``/create`` and readers page through ``/`` and
+``/api/posts`` with the page cache off, so every index page is a k-way
+merge over the shards. With ``--group-commit`` the posts are written
+through each database's group-commit writer (GROUP_COMMIT).
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from common import make_app, seed_database, summarize
+
+FAST_HASH = 'pbkdf2:sha256:1000'
+
+
+def writes(app, authors, posts):
+    latencies = []
+    errors = [0]
+    ready = threading.Barrier(authors + 1)
+
+    def author(n):
+        client = app.test_client()
+        client.post('/auth/login',
+                    data={'username': f'user{n}', 'password': 'password'})
+        ready.wait()
+        for i in range(posts):
+            start = time.perf_counter()
+            response = client.post(
+                '/create', data={'title': f'{n}-{i}', 'body': 'Benchmark.'}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 302:
+                errors[0] += 1
+
+    threads = [
+        threading.Thread(target=author, args=(n,))
+        for n in range(1, authors + 1)
+    ]
+    for t in threads:
+        t.start()
+    ready.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+
+    return summarize(latencies, time.perf_counter() - start, errors[0])
+
+
+def reads(app, requests):
+    client = app.test_client()
+    latencies = []
+    start = time.perf_counter()
+
+    for n in range(requests):
+        begin = time.perf_counter()
+        client.get('/api/posts' if n % 2 else '/')
+        latencies.append(time.perf_counter() - begin)
+
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run(shards, args):
+    with tempfile.TemporaryDirectory() as folder:
+        config = {
+            'SHARDS': shards,
+            'SHARD_DATABASE': os.path.join(folder, 'shard-{}.sqlite'),
+            'DB_POOL_SIZE': args.authors,
+            'PAGE_CACHE_BYTES': 0,
+            'PASSWORD_HASH_METHOD': FAST_HASH,
+            'RENDER_WORKERS': 0,
+            'GROUP_COMMIT': args.group_commit,
+        }
+        path = os.path.join(folder, 'flaskr.sqlite')
+        seed_database(path, users=args.authors, posts=args.seed_posts,
+                      **config)
+        app = make_app(path, **config)
+
+        return {
+            'writes': writes(app, args.authors, args.posts),
+            'reads': reads(app, args.requests),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--authors', type=int, default=32)
+    parser.add_argument('--posts', type=int, default=20,
+                        help='posts written by each author')
+    parser.add_argument('--seed-posts', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='index pages read')
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 4, 8])
+    parser.add_argument('--group-commit', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    for shards in args.shards:
+        results[f'{shards} shards' if shards else 'unsharded'] = run(
+            shards, args
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
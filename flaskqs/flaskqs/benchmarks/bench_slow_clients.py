@@ -0,0 +1,193 @@
+"""Latency of ordinary requests while many slow clients hold connections,
+on a fixed pool of worker threads under werkzeug vs under uvicorn
+through flaskr.asgi.
+
+    python benchmarks/bench_slow_clients.py --slow-clients 64 --workers 8
+
+``--slow send`` trickles each slow client's request headers out a byte at
+a time; ``--slow read`` asks for a large page and reads it a little at a
+time. ``--workers`` is also the ASGI_THREADS of the uvicorn run, which
+needs uvicorn and asgiref and is skipped without them.
+"""
+import argparse
+import http.client
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+from common import (
+    QuietHandler, make_app, seed_database, summarize, temp_database
+)
+
+
+class PooledServer(BaseWSGIServer):
+    """A werkzeug server handling requests on ``workers`` threads, the way
+    a sync worker process with a fixed thread count does.
+    """
+
+    def __init__(self, app, workers):
+        super().__init__('127.0.0.1', 0, app, handler=QuietHandler)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_sync(app, workers):
+    server = PooledServer(app, workers)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.pool.shutdown(wait=False, cancel_futures=True)
+
+    return server.server_port, stop
+
+
+def serve_asgi(app):
+    import uvicorn
+    from flaskr.asgi import wrap
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(
+        wrap(app), log_level='warning', lifespan='off'
+    ))
+    thread = threading.Thread(
+        target=server.run, kwargs={'sockets': [sock]}, daemon=True
+    )
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return sock.getsockname()[1], stop
+
+
+def slow_client(port, mode, stop):
+    sock = socket.socket()
+    # a small receive window so the server can't hand the page to the kernel
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(('127.0.0.1', port))
+    sock.settimeout(1)
+
+    try:
+        if mode == 'send':
+            request = b'GET / HTTP/1.1\r\nHost: localhost\r\nX-Pad: '
+            while not stop.is_set():
+                sock.send(request[:1] if request else b'x')
+                request = request[1:]
+                time.sleep(0.1)
+        else:
+            sock.sendall(
+                b'GET /api/posts HTTP/1.1\r\nHost: localhost\r\n\r\n'
+            )
+            while not stop.is_set():
+                try:
+                    if not sock.recv(512):
+                        break
+                except socket.timeout:
+                    pass
+                time.sleep(0.1)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def measure(port, requests, timeout):
+    latencies, errors = [], 0
+    start = time.perf_counter()
+
+    for _ in range(requests):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        begin = time.perf_counter()
+        try:
+            conn.request('GET', '/api/posts/1?fields=id,title')
+            conn.getresponse().read()
+            latencies.append(time.perf_counter() - begin)
+        except OSError:
+            errors += 1
+        finally:
+            conn.close()
+
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def run(path, label, args):
+    app = make_app(path, POSTS_PER_PAGE=args.page_size, PAGE_CACHE_BYTES=0,
+                   ASGI_THREADS=args.workers)
+
+    if label == 'sync':
+        port, stop_server = serve_sync(app, args.workers)
+    else:
+        port, stop_server = serve_asgi(app)
+
+    stop = threading.Event()
+    clients = [
+        threading.Thread(
+            target=slow_client,
+            args=(port, args.slow, stop), daemon=True,
+        )
+        for _ in range(args.slow_clients)
+    ]
+
+    try:
+        for client in clients:
+            client.start()
+        time.sleep(0.5)
+        return measure(port, args.requests, args.timeout)
+    finally:
+        stop.set()
+        for client in clients:
+            client.join()
+        stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--slow', choices=['send', 'read'], default='send')
+    parser.add_argument('--slow-clients', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Request threads of each server.')
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='Posts on the page the slow readers ask for.')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        seed_database(path, users=10, posts=args.posts)
+
+        for label in ('sync', 'asgi'):
+            try:
+                result = run(path, label, args)
+            except ImportError as e:
+                print(f'{label:>5}: skipped ({e})')
+                continue
+
+            latency = result.get('latency_ms', {})
+            print(f"{label:>5}: {result['requests']} ok,"
+                  f" {result['errors']} timed out,"
+                  f" p50={latency.get('p50', 0):.1f}ms"
+                  f" p99={latency.get('p99', 0):.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Compare time-to-first-byte of a large index page, buffered vs streamed.
+
+    python benchmarks/bench_ttfb.py --posts 5000 --page-size 2000
+"""
+import argparse
+import http.client
+import statistics
+import time
+
+from common import make_app, seed_database, serve, temp_database
+
+
+def run(path, stream, page_size, requests):
+    app = make_app(
+        path, POSTS_PER_PAGE=page_size, PAGE_CACHE_BYTES=0,
+        STREAM_TEMPLATES=stream,
+    )
+    first_byte, total = [], []
+
+    with serve(app) as port:
+        for _ in range(requests):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            start = time.perf_counter()
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            response.read(1)
+            first_byte.append(time.perf_counter() - start)
+            response.read()
+            total.append(time.perf_counter() - start)
+            conn.close()
+
+    return {
+        'ttfb_p50_ms': statistics.median(first_byte) * 1000,
+        'total_p50_ms': statistics.median(total) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--page-size', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        seed_database(path, users=10, posts=args.posts)
+
+        for label, stream in (('buffered', False), ('streamed', True)):
+            result = run(path, stream, args.page_size, args.requests)
+            print(f'{label:>8}: ' + ', '.join(
+                f'{k}={v:.1f}' for k, v in result.items()
+            ))
+
+
+if __name__ == '__main__':
+    main()
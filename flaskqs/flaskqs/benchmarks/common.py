@@ -0,0 +1,154 @@
+"""Helpers shared by the benchmark scripts.
+
+Importing this module puts the project root (the directory holding
+flaskr/ and instance/) on sys.path, so the scripts can be run as
+``python benchmarks/run.py`` from anywhere without installing flaskr.
+"""
+import http.client
+import http.cookies
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import urllib.parse
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flaskr import create_app
+from flaskr.db import get_pool, init_db
+from flaskr.transfer import seed
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+@contextmanager
+def temp_database():
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+
+    try:
+        yield path
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+
+def make_app(path, **config):
+    return create_app({
+        'DATABASE': path,
+        'HASH_WORKERS': 0,
+        'SLOW_QUERY_MS': None,
+        # every client logs in from 127.0.0.1
+        'AUTH_RATE_LIMIT_IP': None,
+        'AUTH_RATE_LIMIT_USERNAME': None,
+        **config,
+    })
+
+
+def seed_database(path, users=0, posts=0, **config):
+    app = make_app(path, **config)
+    with app.app_context():
+        init_db()
+        if users or posts:
+            seed(users, posts)
+        get_pool().close()
+
+
+@contextmanager
+def serve(app):
+    """Run ``app`` on a threaded werkzeug server on a free port."""
+    server = make_server(
+        '127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield server.server_port
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+class HTTPClient:
+    """Just enough of the test client's interface over a real socket,
+    keeping the session cookie between requests.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = http.cookies.SimpleCookie()
+
+    def get(self, path, headers=None):
+        return self.request('GET', path, None, headers or {})
+
+    def post(self, path, data=None, headers=None):
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        body = urllib.parse.urlencode(data or {})
+        return self.request('POST', path, body, headers)
+
+    def request(self, method, path, body, headers):
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                f'{k}={v.value}' for k, v in self.cookies.items()
+            )
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.data = response.read()
+            for header in response.headers.get_all('Set-Cookie') or ():
+                self.cookies.load(header)
+            response.status_code = response.status
+            return response
+        finally:
+            conn.close()
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Turn per-request latencies (in seconds) into the figures every
+    benchmark reports.
+    """
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,32 @@
+"""Compare two result files written by run.py.
+
+    python benchmarks/compare.py before.json after.json
+"""
+import json
+import sys
+
+
+def change(old, new):
+    if not old:
+        return ''
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def main(before, after):
+    with open(before) as f:
+        old = json.load(f)
+    with open(after) as f:
+        new = json.load(f)
+
+    print(f"{old['scenario']} ({old['commit']} -> {new['commit']})")
+    rows = [('throughput_rps', old['throughput_rps'], new['throughput_rps'])]
+    rows += [
+        (f'{key} ms', old['latency_ms'][key], new['latency_ms'][key])
+        for key in ('p50', 'p95', 'p99')
+    ]
+    for name, a, b in rows:
+        print(f'{name:>15} {a:>12.2f} {b:>12.2f} {change(a, b):>9}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
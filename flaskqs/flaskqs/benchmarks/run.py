@@ -0,0 +1,193 @@
+"""Drive a load scenario against flaskr and print the results as JSON.
+
+Scenarios: index (anonymous reads of /), login, crud (create, update and
+delete a post as a logged-in author) and mixed (80% index, 10% API post
+reads, 10% crud). ``--mode client`` goes through the Flask test client,
+``--mode server`` through a real multi-threaded werkzeug server.
+
+    python benchmarks/run.py index --mode server --threads 8
+    python benchmarks/run.py mixed --posts 100000 -c PAGE_CACHE_BYTES=0 \\
+        -o before.json
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from common import (
+    HTTPClient, git_commit, make_app, seed_database, serve, summarize,
+    temp_database
+)
+
+
+class TimingClient:
+    def __init__(self, client, latencies):
+        self.client = client
+        self.latencies = latencies
+        self.errors = 0
+
+    def get(self, *args, **kwargs):
+        return self._timed(self.client.get, *args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self._timed(self.client.post, *args, **kwargs)
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        response = method(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+
+def login(client, n):
+    client.post(
+        '/auth/login', data={'username': f'user{n}', 'password': 'password'}
+    )
+
+
+def index(client, rng, args, worker):
+    client.get('/')
+
+
+def login_scenario(client, rng, args, worker):
+    n = rng.randint(1, args.users)
+    client.post(
+        '/auth/login', data={'username': f'user{n}', 'password': 'password'}
+    )
+
+
+def crud(client, rng, args, worker):
+    title = f'bench {worker} {rng.random()}'
+    client.post('/create', data={'title': title, 'body': 'Benchmark post.'})
+
+    # the newest page holds our post unless every thread just posted
+    response = client.get('/api/posts?fields=id,title')
+    ids = [
+        post['id'] for post in json.loads(response.data)['posts']
+        if post['title'] == title
+    ]
+    if not ids:
+        return
+
+    client.post(f'/{ids[0]}/update',
+                data={'title': title, 'body': 'Edited benchmark post.'})
+    client.post(f'/{ids[0]}/delete')
+
+
+def mixed(client, rng, args, worker):
+    roll = rng.random()
+
+    if roll < 0.8:
+        client.get('/')
+    elif roll < 0.9:
+        client.get(f'/api/posts/{rng.randint(1, max(args.posts, 1))}')
+    else:
+        crud(client, rng, args, worker)
+
+
+SCENARIOS = {
+    'index': (index, False),
+    'login': (login_scenario, False),
+    'crud': (crud, True),
+    'mixed': (mixed, True),
+}
+
+
+def parse_config(pairs):
+    config = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def run(app, args, port=None):
+    scenario, needs_login = SCENARIOS[args.scenario]
+    per_thread = max(args.requests // args.threads, 1)
+    latencies = []
+    clients = []
+    ready = threading.Barrier(args.threads + 1)
+
+    def worker(n):
+        rng = random.Random(n)
+        raw = app.test_client() if port is None else HTTPClient(port)
+        if needs_login:
+            login(raw, n % args.users + 1)
+        client = TimingClient(raw, [])
+        clients.append(client)
+        ready.wait()
+        for _ in range(per_thread):
+            scenario(client, rng, args, n)
+
+    threads = [
+        threading.Thread(target=worker, args=(n,))
+        for n in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    ready.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        latencies.extend(client.latencies)
+    return summarize(latencies, elapsed, sum(c.errors for c in clients))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('scenario', choices=SCENARIOS)
+    parser.add_argument('--mode', choices=('client', 'server'),
+                        default='client')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='scenario iterations, split across threads')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('-c', '--config', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='app config override, VALUE parsed as JSON')
+    parser.add_argument('-o', '--output', help='also write results here')
+    args = parser.parse_args()
+    config = parse_config(args.config)
+
+    with temp_database() as path:
+        seed_database(path, args.users, args.posts, **config)
+        app = make_app(path, **config)
+
+        if args.mode == 'server':
+            with serve(app) as port:
+                summary = run(app, args, port)
+        else:
+            summary = run(app, args)
+
+    result = {
+        'commit': git_commit(),
+        'scenario': args.scenario,
+        'mode': args.mode,
+        'threads': args.threads,
+        'users': args.users,
+        'posts': args.posts,
+        'config': config,
+        **summary,
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,43 +1,183 @@
-import os
-
-from flask import Flask
-
-
-def create_app(test_config=None):
-    # create and configure the app
-    app = Flask(__name__, instance_relative_config=True)
-    app.config.from_mapping(
-        SECRET_KEY='dev',
-        DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
-    )
-
-    if test_config is None:
-        # load the instance config, if it exists, when not testing
-        app.config.from_pyfile('config.py', silent=True)
-    else:
-        # load the test config if passed in
-        app.config.from_mapping(test_config)
-
-    # ensure the instance folder exists
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
-
-    # a simple page that says hello
-    @app.route('/hello')
-    def hello():
-        return 'Hello, World!'
-    
-    from . import db
-    db.init_app(app)
-
-    from . import auth
-    app.register_blueprint(auth.bp)
-
-    from . import blog
-    app.register_blueprint(blog.bp)
-    app.add_url_rule('/', endpoint='index')
-
-    return app
-
+import os
+
+from flask import Flask
+
+from flaskr.startup import Stopwatch
+
+
+def create_app(test_config=None):
+    # times each phase below, see flask startup-profile
+    stopwatch = Stopwatch()
+
+    # create and configure the app
+    app = Flask(__name__, instance_relative_config=True)
+    app.config.from_mapping(
+        SECRET_KEY='dev',
+        DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
+        # file behind get_read_db(), e.g. a replica refreshed in place with
+        # the backup API; None reads DATABASE
+        READ_DATABASE=None,
+        # connection pools (one per role); a size of 0 opens a connection
+        # per request
+        DB_POOL_SIZE=5,
+        DB_POOL_TIMEOUT=5.0,
+        # split posts by author over this many SHARD_DATABASE files ({} is
+        # the shard number), see flaskr.shards; 0 keeps them in DATABASE
+        SHARDS=0,
+        SHARD_DATABASE=os.path.join(
+            app.instance_path, 'flaskr-shard-{}.sqlite'
+        ),
+        # negative cache_size is in KiB, mmap_size is in bytes
+        DB_CACHE_SIZE=-16000,
+        DB_MMAP_SIZE=64 * 1024 * 1024,
+        POSTS_PER_PAGE=20,
+        # posts are copied into the feed of every follower when written,
+        # except those of authors with more than FEED_FANOUT_LIMIT
+        # followers, which feeds read as they're shown; following someone
+        # copies in their last FEED_BACKFILL posts
+        FEED_FANOUT_LIMIT=10000,
+        FEED_BACKFILL=20,
+        # leave the fan-out of new posts to `flask worker`
+        FEED_FANOUT_JOBS=False,
+        # send the index while its posts are still being read
+        STREAM_TEMPLATES=False,
+        # funnel post writes through one thread that commits them in
+        # groups, waiting up to GROUP_COMMIT_WINDOW_MS to fill a group; a
+        # write not committed within DB_POOL_TIMEOUT seconds gets a 503
+        GROUP_COMMIT=False,
+        GROUP_COMMIT_WINDOW_MS=2,
+        GROUP_COMMIT_MAX_BATCH=256,
+        # log statements slower than this many milliseconds; None disables
+        SLOW_QUERY_MS=100,
+        # rendered index pages kept in memory; 0 disables the cache
+        PAGE_CACHE_BYTES=8 * 1024 * 1024,
+        # user and post rows, kept for at most ROW_CACHE_TTL seconds
+        ROW_CACHE_SIZE=1024,
+        ROW_CACHE_TTL=60,
+        # spell out every parameter (as werkzeug stores it) or each login
+        # will count as a cost change and rehash the password
+        PASSWORD_HASH_METHOD='scrypt:32768:8:1',
+        # processes that hash passwords (None: one per CPU, 0: inline) and
+        # how many hashes may wait for them before logins get a 503
+        HASH_WORKERS=None,
+        HASH_MAX_PENDING=64,
+        HASH_RETRY_AFTER=1,
+        # token buckets limiting POSTs to login and register per client IP
+        # and per username: (burst, interval) lets BURST attempts through
+        # at once and then one every INTERVAL seconds; None disables one
+        AUTH_RATE_LIMIT_IP=(20, 1.0),
+        AUTH_RATE_LIMIT_USERNAME=(10, 6.0),
+        # share the buckets between workers through this SQLite file; None
+        # keeps them in each process's memory
+        AUTH_RATE_LIMIT_DATABASE=None,
+        # requests flaskr.asgi runs at once, each on a thread of its own
+        ASGI_THREADS=8,
+        # processes rendering Markdown for bulk loads and rerender-posts
+        # (None: one per CPU, 0: inline)
+        RENDER_WORKERS=None,
+        # serve static files under content-hashed names, cached for a year,
+        # built into STATIC_BUILD_FOLDER
+        STATIC_FINGERPRINT=True,
+        STATIC_BUILD_FOLDER=os.path.join(app.instance_path, 'static'),
+        # keep compiled templates in instance/jinja-cache across restarts,
+        # and optionally load them all before the first request
+        TEMPLATE_BYTECODE_CACHE=True,
+        PREWARM_TEMPLATES=False,
+        # `flask worker` runs JOB_WORKERS background jobs at a time (None:
+        # one per CPU) on threads, or on processes with JOB_PROCESSES
+        JOB_WORKERS=None,
+        JOB_PROCESSES=False,
+        # a failed job runs again JOB_RETRY_DELAY seconds later, doubled
+        # each time, at most JOB_MAX_ATTEMPTS times in all; one running
+        # for longer than JOB_TIMEOUT seconds counts as failed
+        JOB_MAX_ATTEMPTS=5,
+        JOB_RETRY_DELAY=10,
+        JOB_TIMEOUT=600,
+        # seconds between looks at the job table, and between reports of
+        # its depth
+        JOB_POLL_INTERVAL=1.0,
+        JOB_REPORT_INTERVAL=60,
+    )
+
+    if test_config is None:
+        # load the instance config, if it exists, when not testing
+        app.config.from_pyfile('config.py', silent=True)
+    else:
+        # load the test config if passed in
+        app.config.from_mapping(test_config)
+
+    # ensure the instance folder exists
+    try:
+        os.makedirs(app.instance_path)
+    except OSError:
+        pass
+
+    stopwatch.lap('config')
+
+    # a simple page that says hello
+    @app.route('/hello')
+    def hello():
+        return 'Hello, World!'
+    
+    from . import db
+    db.init_app(app)
+    stopwatch.lap('db')
+
+    from . import archive
+    archive.init_app(app)
+    stopwatch.lap('archive')
+
+    from . import render
+    render.init_app(app)
+    stopwatch.lap('render')
+
+    from . import transfer
+    transfer.init_app(app)
+    stopwatch.lap('transfer')
+
+    from . import shards
+    shards.init_app(app)
+    stopwatch.lap('shards')
+
+    from . import jobs
+    jobs.init_app(app)
+    stopwatch.lap('jobs')
+
+    from . import plans
+    plans.init_app(app)
+    stopwatch.lap('plans')
+
+    from . import metrics
+    metrics.init_app(app)
+    stopwatch.lap('metrics')
+
+    from . import ratelimit
+    ratelimit.init_app(app)
+    stopwatch.lap('ratelimit')
+
+    from . import auth
+    app.register_blueprint(auth.bp)
+    stopwatch.lap('auth')
+
+    from . import blog
+    app.register_blueprint(blog.bp)
+    app.add_url_rule('/', endpoint='index')
+    stopwatch.lap('blog')
+
+    from . import api
+    app.register_blueprint(api.bp)
+    stopwatch.lap('api')
+
+    from . import assets
+    assets.init_app(app)
+    stopwatch.lap('assets')
+
+    from . import serve
+    serve.init_app(app)
+    stopwatch.lap('serve')
+
+    from . import startup
+    startup.init_app(app, stopwatch)
+
+    return app
+
@@ -0,0 +1,85 @@
+import json
+
+from flask import Blueprint, current_app, jsonify, request
+from werkzeug.exceptions import HTTPException, abort
+
+from flaskr.blog import get_page, get_post
+from flaskr.cache import get_page_cache, sync_caches
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+FIELDS = ('id', 'title', 'body', 'body_html', 'created', 'author_id',
+          'username')
+
+def select_fields():
+    fields = request.args.get('fields')
+
+    if not fields:
+        return FIELDS
+
+    fields = tuple(fields.split(','))
+    unknown = set(fields).difference(FIELDS)
+
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(sorted(unknown))}.")
+
+    return fields
+
+def serialize(post, fields):
+    return {
+        field: post[field].isoformat(' ') if field == 'created' else post[field]
+        for field in fields
+    }
+
+def cached_json(build):
+    """Return the JSON document made by ``build`` for this URL, from the
+    page cache when possible, answering conditional requests from it.
+    """
+    sync_caches()
+    cache = get_page_cache()
+    key = ('api', request.full_path)
+    entry = cache.get(key)
+
+    if entry is None:
+        version = cache.version
+        entry = cache.set(key, dump(build()), version)
+
+    return json_response(entry)
+
+def dump(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False)
+
+def json_response(entry):
+    body, etag = entry
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = get_page_cache().modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def page_document(fields):
+    page = get_page(request.args.get('before'), request.args.get('after'))
+    return {
+        'posts': [serialize(post, fields) for post in page],
+        'prev': page.prev_cursor,
+        'next': page.next_cursor,
+    }
+
+def post_document(id, fields):
+    return serialize(get_post(id, check_author=False), fields)
+
+@bp.route('/posts')
+def posts():
+    fields = select_fields()
+    return cached_json(lambda: page_document(fields))
+
+@bp.route('/posts/<int:id>')
+def post(id):
+    fields = select_fields()
+    return cached_json(lambda: post_document(id, fields))
+
+@bp.errorhandler(HTTPException)
+def handle_error(e):
+    response = jsonify(error=e.name, description=e.description)
+    response.status_code = e.code
+    return response
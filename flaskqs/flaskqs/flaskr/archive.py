@@ -0,0 +1,120 @@
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import click
+
+from flaskr.db import get_write_db, post_shards
+
+
+def deflate(text):
+    return None if text is None else zlib.compress(text.encode('utf8'))
+
+
+def inflate(data):
+    return None if data is None else zlib.decompress(data).decode('utf8')
+
+
+def register_functions(conn):
+    # the SQL functions the archive is read and written with
+    conn.create_function('deflate', 1, deflate, deterministic=True)
+    conn.create_function('inflate', 1, inflate, deterministic=True)
+
+
+def database_size(db):
+    page_size = db.execute('PRAGMA page_size').fetchone()[0]
+    pages = db.execute('PRAGMA page_count').fetchone()[0]
+    free = db.execute('PRAGMA freelist_count').fetchone()[0]
+    return pages * page_size, free * page_size
+
+
+def total_size(shards):
+    sizes = [database_size(get_write_db(shard)) for shard in shards]
+    return sum(size for size, _ in sizes), sum(free for _, free in sizes)
+
+
+def archive_posts(before, batch_size=5000, shard=None):
+    """Move the bodies (source and HTML) of the posts created before
+    ``before`` into post_archive, compressed, and return how many posts
+    were archived.
+
+    An archived post keeps its row in post with an empty body and
+    archived set, so the indexes, cursors and counters over post don't
+    change; readers get the body back, inflate()d, from the post_full
+    view. The search index is left as it is, see post_fts_update in
+    schema.sql.
+    """
+    db = get_write_db(shard)
+    before = before.isoformat(' ')
+    last = ('', 0)
+    count = 0
+
+    while True:
+        batch = db.execute(
+            'SELECT created, id FROM post'
+            ' WHERE (created, id) > (?, ?) AND created < ?'
+            ' ORDER BY created, id LIMIT ?',
+            (*last, before, batch_size)
+        ).fetchall()
+
+        if not batch:
+            break
+
+        created, id = batch[-1]
+        bounds = (*last, created.isoformat(' '), id)
+        db.execute(
+            'INSERT INTO post_archive (id, body, body_html)'
+            ' SELECT id, deflate(body), deflate(body_html) FROM post'
+            ' WHERE (created, id) > (?, ?) AND (created, id) <= (?, ?)'
+            ' AND NOT archived',
+            bounds
+        )
+        cursor = db.execute(
+            "UPDATE post SET body = '', body_html = '', archived = 1"
+            ' WHERE (created, id) > (?, ?) AND (created, id) <= (?, ?)'
+            ' AND NOT archived',
+            bounds
+        )
+        db.commit()
+        count += cursor.rowcount
+        last = bounds[2:]
+
+    return count
+
+
+@click.command('archive-posts')
+@click.option('--older-than', type=int, required=True, metavar='DAYS',
+              help='Archive the posts created more than DAYS days ago.')
+@click.option('--batch-size', type=int, default=5000, show_default=True,
+              help='Posts per transaction.')
+@click.option('--vacuum', is_flag=True,
+              help='Rebuild the database afterwards to give back the space.')
+def archive_posts_command(older_than, batch_size, vacuum):
+    """Compress the bodies of old posts into post_archive."""
+    shards = post_shards()
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    size, _ = total_size(shards)
+    start = time.perf_counter()
+
+    count = sum(
+        archive_posts(now - timedelta(days=older_than), batch_size, shard)
+        for shard in shards
+    )
+    elapsed = time.perf_counter() - start
+    click.echo(f'Archived {count} posts in {elapsed:.2f}s.')
+
+    if vacuum:
+        for shard in shards:
+            db = get_write_db(shard)
+            db.execute('VACUUM')
+            # VACUUM goes through the WAL, which would otherwise stay that big
+            db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    after, free = total_size(shards)
+    click.echo(f'Database size: {size / 2**20:.1f} MiB ->'
+               f' {after / 2**20:.1f} MiB ({free / 2**20:.1f} MiB free).')
+
+
+def init_app(app):
+    app.extensions['flaskr_on_connect'].append(register_functions)
+    app.cli.add_command(archive_posts_command)
@@ -0,0 +1,54 @@
+"""The app wrapped for ASGI servers, e.g.::
+
+    uvicorn flaskr.asgi:app
+
+asgiref's WsgiToAsgi runs every request on the one thread it keeps for
+sync code, so a process would serve its requests one at a time; this
+wrapper runs them on a pool of ASGI_THREADS threads instead. Needs the
+``async`` extra (asgiref).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from flaskr import create_app
+
+# the undecorated method, which asgiref wraps in a thread-sensitive
+# sync_to_async
+run_wsgi_app = vars(WsgiToAsgiInstance)['run_wsgi_app'].func
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """Like WsgiToAsgi, but runs each request on one of ``threads``
+    threads; a request arriving while all of them are busy waits for one.
+    """
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(
+            threads, thread_name_prefix='request'
+        )
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedInstance(self.wsgi_application, self.executor)(
+            scope, receive, send
+        )
+
+
+class ThreadedInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(
+            run_wsgi_app, thread_sensitive=False, executor=self.executor
+        )(self, body)
+
+
+def wrap(app):
+    return ThreadedWsgiToAsgi(app, app.config['ASGI_THREADS'])
+
+
+app = wrap(create_app())
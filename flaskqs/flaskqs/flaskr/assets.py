@@ -0,0 +1,138 @@
+"""Fingerprinted, precompressed static files.
+
+At startup every file in the static folder is copied into
+STATIC_BUILD_FOLDER under a name carrying a hash of its contents, next to
+a gzipped copy when that is smaller. ``url_for('static', ...)`` then
+points at the fingerprinted name, which never changes meaning and so is
+served to be cached for a year without revalidation.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory
+
+ONE_YEAR = 365 * 24 * 60 * 60
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json',
+                'image/svg+xml')
+
+
+def fingerprint(filename, data):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def compressible(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or ''
+    return mimetype.startswith(COMPRESSIBLE)
+
+
+def build(source, target):
+    """Copy the files under ``source`` into ``target`` under fingerprinted
+    names, with gzipped copies, and return {filename: fingerprinted name}.
+    Files already built are left alone.
+    """
+    manifest = {}
+
+    if source is None or not os.path.isdir(source):
+        return manifest
+
+    for dirpath, _, filenames in os.walk(source):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            filename = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            built = fingerprint(filename, data)
+            manifest[filename] = built
+            output = os.path.join(target, built)
+
+            if os.path.exists(output):
+                continue
+
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            if compressible(filename):
+                compressed = gzip.compress(data, 9, mtime=0)
+                if len(compressed) < len(data):
+                    write_file(output + '.gz', compressed)
+            write_file(output, data)
+
+    return manifest
+
+
+def write_file(path, data):
+    # write then rename, so a concurrent reader never sees half a file
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def get_build_folder(app):
+    return app.config['STATIC_BUILD_FOLDER']
+
+
+def fingerprint_url(endpoint, values):
+    if endpoint != 'static':
+        return
+
+    manifest = current_app.extensions['flaskr_assets']
+    filename = values.get('filename')
+
+    if filename in manifest:
+        values['filename'] = manifest[filename]
+
+
+def serve_static(filename):
+    app = current_app
+    built = app.extensions['flaskr_assets_built']
+
+    if filename not in built:
+        return app.send_static_file(filename)
+
+    folder = get_build_folder(app)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    gzipped = (
+        request.accept_encodings['gzip']
+        and os.path.exists(os.path.join(folder, filename + '.gz'))
+    )
+
+    response = send_from_directory(
+        folder, filename + '.gz' if gzipped else filename,
+        mimetype=mimetype, max_age=ONE_YEAR,
+    )
+    if gzipped:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def load(app):
+    manifest = build(app.static_folder, get_build_folder(app))
+    app.extensions['flaskr_assets'] = manifest
+    app.extensions['flaskr_assets_built'] = set(manifest.values())
+    return manifest
+
+
+@click.command('build-static')
+def build_static_command():
+    """Fingerprint and compress the static files ahead of startup."""
+    manifest = load(current_app)
+    for filename, built in sorted(manifest.items()):
+        click.echo(f'{filename} -> {built}')
+
+
+def init_app(app):
+    app.cli.add_command(build_static_command)
+
+    if not app.config['STATIC_FINGERPRINT']:
+        return
+
+    load(app)
+    app.url_defaults(fingerprint_url)
+    app.view_functions['static'] = serve_static
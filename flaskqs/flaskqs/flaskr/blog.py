@@ -1,96 +1,544 @@
-from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
-)
-from werkzeug.exceptions import abort
-
-from flaskr.auth import login_required
-from flaskr.db import get_db
-
-bp = Blueprint('blog', __name__)
-
-@bp.route('/')
-def index():
-    db = get_db()
-    posts = db.execute(
-        'SELECT p.id, title, body, created, author_id, username'
-        ' FROM post p JOIN user u ON p.author_id = u.id'
-        ' ORDER BY created DESC'
-    ).fetchall()
-    return render_template('blog/index.html', posts=posts)
-
-@bp.route('/create', methods=('GET', 'POST'))
-@login_required
-def create():
-    if request.method == 'POST':
-        title = request.form['title']
-        body = request.form['body']
-        error = None
-
-        if not title:
-            error = 'Title is required.'
-
-        if error is not None:
-            flash(error)
-        else:
-            db = get_db()
-            db.execute(
-                'INSERT INTO post (title, body, author_id)'
-                ' VALUES (?, ?, ?)',
-                (title, body, g.user['id'])
-            )
-            db.commit()
-            return redirect(url_for('blog.index'))
-
-    return render_template('blog/create.html')
-
-def get_post(id, check_author=True):
-    post = get_db().execute(
-        'SELECT p.id, title, body, created, author_id, username'
-        ' FROM post p JOIN user u ON p.author_id = u.id'
-        ' WHERE p.id = ?',
-        (id,)
-    ).fetchone()
-
-    if post is None:
-        abort(404, f"Post id {id} doesn't exist.")
-
-    if check_author and post['author_id'] != g.user['id']:
-        abort(403)
-
-    return post
-
-@bp.route('/<int:id>/update', methods=('GET', 'POST'))
-@login_required
-def update(id):
-    post = get_post(id)
-
-    if request.method == 'POST':
-        title = request.form['title']
-        body = request.form['body']
-        error = None
-
-        if not title:
-            error = 'Title is required.'
-
-        if error is not None:
-            flash(error)
-        else:
-            db = get_db()
-            db.execute(
-                'UPDATE post SET title = ?, body = ?'
-                ' WHERE id = ?',
-                (title, body, id)
-            )
-            db.commit()
-            return redirect(url_for('blog.index'))
-
-    return render_template('blog/update.html', post=post)
-
-@bp.route('/<int:id>/delete', methods=('POST',))
-@login_required
-def delete(id):
-    get_post(id)
-    db = get_db()
-    db.execute('DELETE FROM post WHERE id = ?', (id,))
-    db.commit()
+import heapq
+import itertools
+import json
+from datetime import datetime
+from operator import itemgetter
+
+from flask import (
+    Blueprint, Response, current_app, flash, g, make_response, redirect,
+    render_template, request, session, stream_template, url_for
+)
+from markupsafe import Markup, escape
+from werkzeug.exceptions import abort
+
+from flaskr.auth import login_required
+from flaskr.cache import (
+    cached_row, get_page_cache, get_row_cache, sync_caches
+)
+from flaskr.db import get_read_db, post_shards
+from flaskr.feed import (
+    fan_out_post, follow_author, unfan_post, unfollow_author
+)
+from flaskr.jobs import enqueue
+from flaskr.render import RENDER_VERSION, render_markdown
+from flaskr.shards import author_shard, post_shard, route_post, unroute_post
+from flaskr.writer import execute_write
+
+bp = Blueprint('blog', __name__)
+
+def format_cursor(post):
+    return f"{post['created'].isoformat(' ')},{post['id']}"
+
+def parse_cursor(value):
+    try:
+        created, id = value.rsplit(',', 1)
+        return datetime.fromisoformat(created).isoformat(' '), int(id)
+    except ValueError:
+        abort(400, f"Invalid page cursor {value!r}.")
+
+class PostPage:
+    """One page of posts, newest first, read from the cursor as it is
+    iterated so a page can be streamed out while it is still being read.
+
+    The cursors of the neighbouring pages (None when there is no such
+    page) are only known once the posts have been iterated.
+    """
+
+    def __init__(self, rows, per_page, has_prev, has_next=False):
+        self._rows = rows
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.first = self.last = None
+
+    def __iter__(self):
+        for count, post in enumerate(self._rows):
+            if count == self.per_page:
+                # the query asks for one row more than it shows
+                self.has_next = True
+                break
+
+            if self.first is None:
+                self.first = post
+            self.last = post
+            yield post
+
+    def fetchall(self):
+        # read the rows now rather than while the page is iterated
+        self._rows = list(self._rows)
+        return self
+
+    @property
+    def prev_cursor(self):
+        if self.first is not None and self.has_prev:
+            return format_cursor(self.first)
+
+    @property
+    def next_cursor(self):
+        if self.last is not None and self.has_next:
+            return format_cursor(self.last)
+
+def post_order(post):
+    return post['created'], post['id']
+
+def read_posts(query, args, descending=True):
+    """Run ``query``, which orders posts by (created, id), on every database
+    holding posts and merge the rows into one ordered stream as they are
+    read, so each shard gives no more rows than the page takes.
+    """
+    cursors = [
+        get_read_db(shard).execute(query, args) for shard in post_shards()
+    ]
+
+    if len(cursors) == 1:
+        return cursors[0]
+
+    return heapq.merge(*cursors, key=post_order, reverse=descending)
+
+def get_page(before=None, after=None):
+    """Return a PostPage of the posts before or after a page cursor.
+
+    Pages are addressed by the (created, id) of the post next to them, so
+    every page is a range read on post_created_idx however deep it is.
+    """
+    per_page = current_app.config['POSTS_PER_PAGE']
+
+    if after is not None:
+        # read upwards from the cursor, then flip the (short) page over
+        posts = list(read_posts(
+            'SELECT p.id, title, body, body_html,'
+            ' created, author_id, username'
+            ' FROM post_full p JOIN user u ON p.author_id = u.id'
+            ' WHERE (p.created, p.id) > (?, ?)'
+            ' ORDER BY p.created, p.id LIMIT ?',
+            (*parse_cursor(after), per_page + 1), descending=False
+        ))
+        return PostPage(
+            posts[:per_page][::-1], per_page,
+            has_prev=len(posts) > per_page, has_next=True
+        )
+
+    if before is not None:
+        posts = read_posts(
+            'SELECT p.id, title, body, body_html,'
+            ' created, author_id, username'
+            ' FROM post_full p JOIN user u ON p.author_id = u.id'
+            ' WHERE (p.created, p.id) < (?, ?)'
+            ' ORDER BY p.created DESC, p.id DESC LIMIT ?',
+            (*parse_cursor(before), per_page + 1)
+        )
+        return PostPage(posts, per_page, has_prev=True)
+
+    posts = read_posts(
+        'SELECT p.id, title, body, body_html,'
+        ' created, author_id, username'
+        ' FROM post_full p JOIN user u ON p.author_id = u.id'
+        ' ORDER BY p.created DESC, p.id DESC LIMIT ?',
+        (per_page + 1,)
+    )
+    return PostPage(posts, per_page, has_prev=False)
+
+def get_author_page(author_id, before=None, after=None, shard=None):
+    """Like get_page, for the posts of one author, read from
+    post_author_created_idx on the author's shard.
+    """
+    per_page = current_app.config['POSTS_PER_PAGE']
+    db = get_read_db(shard)
+
+    if after is not None:
+        posts = db.execute(
+            'SELECT p.id, title, body, body_html,'
+            ' created, author_id, username'
+            ' FROM post_full p JOIN user u ON p.author_id = u.id'
+            ' WHERE p.author_id = ? AND (p.created, p.id) > (?, ?)'
+            ' ORDER BY p.created, p.id LIMIT ?',
+            (author_id, *parse_cursor(after), per_page + 1)
+        ).fetchall()
+        return PostPage(
+            posts[:per_page][::-1], per_page,
+            has_prev=len(posts) > per_page, has_next=True
+        )
+
+    if before is not None:
+        posts = db.execute(
+            'SELECT p.id, title, body, body_html,'
+            ' created, author_id, username'
+            ' FROM post_full p JOIN user u ON p.author_id = u.id'
+            ' WHERE p.author_id = ? AND (p.created, p.id) < (?, ?)'
+            ' ORDER BY p.created DESC, p.id DESC LIMIT ?',
+            (author_id, *parse_cursor(before), per_page + 1)
+        )
+        return PostPage(posts, per_page, has_prev=True)
+
+    posts = db.execute(
+        'SELECT p.id, title, body, body_html,'
+        ' created, author_id, username'
+        ' FROM post_full p JOIN user u ON p.author_id = u.id'
+        ' WHERE p.author_id = ?'
+        ' ORDER BY p.created DESC, p.id DESC LIMIT ?',
+        (author_id, per_page + 1)
+    )
+    return PostPage(posts, per_page, has_prev=False)
+
+def read_feed(entries, limit):
+    """Return the posts of the first ``limit`` of ``entries``, rows of
+    (id, created, shard) in feed order, each post read from its shard.
+    """
+    entries = list(itertools.islice(entries, limit))
+    ids = {}
+    for entry in entries:
+        ids.setdefault(entry['shard'], []).append(entry['id'])
+
+    posts = {}
+    for shard, shard_ids in ids.items():
+        for post in get_read_db(shard).execute(
+            'SELECT p.id, title, body, body_html,'
+            ' created, author_id, username'
+            ' FROM post_full p JOIN user u ON p.author_id = u.id'
+            ' WHERE p.id IN (SELECT value FROM json_each(?))',
+            (json.dumps(shard_ids),)
+        ):
+            posts[post['id']] = post
+
+    # a post deleted since its entry was read is left out
+    return [posts[e['id']] for e in entries if e['id'] in posts]
+
+def get_feed_page(user_id, before=None, after=None):
+    """Like get_page, for the posts of the authors ``user_id`` follows.
+
+    The page is merged from the user's feed_entry rows and, for each
+    followed author whose posts aren't fanned out (see flaskr.feed), a
+    range read of their posts on post_author_created_idx.
+    """
+    per_page = current_app.config['POSTS_PER_PAGE']
+    db = get_read_db()
+    pulled = db.execute(
+        'SELECT f.author_id, m.shard FROM follow f'
+        ' JOIN follow_count c ON c.author_id = f.author_id'
+        ' LEFT JOIN shard_map m ON m.author_id = f.author_id'
+        ' WHERE f.follower_id = ? AND c.pull',
+        (user_id,)
+    ).fetchall()
+    skipped = json.dumps([row['author_id'] for row in pulled])
+
+    if after is not None:
+        cursor = parse_cursor(after)
+        entries = [db.execute(
+            'SELECT post_id AS id, created, m.shard FROM feed_entry f'
+            ' LEFT JOIN shard_map m ON m.author_id = f.author_id'
+            ' WHERE user_id = ? AND (created, post_id) > (?, ?)'
+            ' AND f.author_id NOT IN (SELECT value FROM json_each(?))'
+            ' ORDER BY created, post_id LIMIT ?',
+            (user_id, *cursor, skipped, per_page + 1)
+        )]
+        entries += [get_read_db(row['shard']).execute(
+            'SELECT p.id, created, m.shard FROM post p'
+            ' LEFT JOIN shard_map m ON m.author_id = p.author_id'
+            ' WHERE p.author_id = ? AND (p.created, p.id) > (?, ?)'
+            ' ORDER BY p.created, p.id LIMIT ?',
+            (row['author_id'], *cursor, per_page + 1)
+        ) for row in pulled]
+        posts = read_feed(heapq.merge(*entries, key=post_order), per_page + 1)
+        return PostPage(
+            posts[:per_page][::-1], per_page,
+            has_prev=len(posts) > per_page, has_next=True
+        )
+
+    if before is not None:
+        cursor = parse_cursor(before)
+        entries = [db.execute(
+            'SELECT post_id AS id, created, m.shard FROM feed_entry f'
+            ' LEFT JOIN shard_map m ON m.author_id = f.author_id'
+            ' WHERE user_id = ? AND (created, post_id) < (?, ?)'
+            ' AND f.author_id NOT IN (SELECT value FROM json_each(?))'
+            ' ORDER BY created DESC, post_id DESC LIMIT ?',
+            (user_id, *cursor, skipped, per_page + 1)
+        )]
+        entries += [get_read_db(row['shard']).execute(
+            'SELECT p.id, created, m.shard FROM post p'
+            ' LEFT JOIN shard_map m ON m.author_id = p.author_id'
+            ' WHERE p.author_id = ? AND (p.created, p.id) < (?, ?)'
+            ' ORDER BY p.created DESC, p.id DESC LIMIT ?',
+            (row['author_id'], *cursor, per_page + 1)
+        ) for row in pulled]
+        posts = heapq.merge(*entries, key=post_order, reverse=True)
+        return PostPage(read_feed(posts, per_page + 1), per_page,
+                        has_prev=True)
+
+    entries = [db.execute(
+        'SELECT post_id AS id, created, m.shard FROM feed_entry f'
+        ' LEFT JOIN shard_map m ON m.author_id = f.author_id'
+        ' WHERE user_id = ?'
+        ' AND f.author_id NOT IN (SELECT value FROM json_each(?))'
+        ' ORDER BY created DESC, post_id DESC LIMIT ?',
+        (user_id, skipped, per_page + 1)
+    )]
+    entries += [get_read_db(row['shard']).execute(
+        'SELECT p.id, created, m.shard FROM post p'
+        ' LEFT JOIN shard_map m ON m.author_id = p.author_id'
+        ' WHERE p.author_id = ?'
+        ' ORDER BY p.created DESC, p.id DESC LIMIT ?',
+        (row['author_id'], per_page + 1)
+    ) for row in pulled]
+    posts = heapq.merge(*entries, key=post_order, reverse=True)
+    return PostPage(read_feed(posts, per_page + 1), per_page, has_prev=False)
+
+@bp.route('/')
+def index():
+    sync_caches()
+    cache = get_page_cache()
+    key = (request.query_string, g.user['id'] if g.user else None)
+    # a page carrying flashed messages belongs to one visitor only
+    cacheable = '_flashes' not in session
+    entry = cache.get(key) if cacheable else None
+
+    if entry is None:
+        version = cache.version
+        posts = get_page(request.args.get('before'), request.args.get('after'))
+
+        if current_app.config['STREAM_TEMPLATES']:
+            chunks = buffer_stream(
+                stream_template('blog/index.html', posts=posts)
+            )
+            if cacheable:
+                chunks = cache_stream(cache, key, chunks, version)
+            return Response(chunks)
+
+        body = render_template('blog/index.html', posts=posts)
+
+        if not cacheable:
+            return body
+
+        entry = cache.set(key, body, version)
+
+    return page_response(entry)
+
+def page_response(entry):
+    body, etag = entry
+    response = make_response(body)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+def buffer_stream(chunks, size=16384):
+    # jinja yields a chunk per template statement, far too small to send
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def cache_stream(cache, key, chunks, version):
+    # pass a streamed page through and cache it once it is complete
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(parts), version)
+
+@bp.route('/user/<username>')
+def author(username):
+    shard = author_shard(username)
+    author = get_read_db(shard).execute(
+        'SELECT u.id, username, coalesce(post_count, 0) AS post_count,'
+        ' last_post, coalesce(followers, 0) AS followers,'
+        ' EXISTS (SELECT 1 FROM follow'
+        ' WHERE follower_id = ? AND author_id = u.id) AS following'
+        ' FROM user u LEFT JOIN user_stats s ON s.user_id = u.id'
+        ' LEFT JOIN follow_count c ON c.author_id = u.id'
+        ' WHERE username = ?',
+        (g.user['id'] if g.user else None, username)
+    ).fetchone()
+
+    if author is None:
+        abort(404, f"User {username!r} doesn't exist.")
+
+    posts = get_author_page(
+        author['id'], request.args.get('before'), request.args.get('after'),
+        shard
+    )
+    return render_template('blog/author.html', author=author, posts=posts)
+
+def get_author_id(username):
+    author = get_read_db().execute(
+        'SELECT id FROM user WHERE username = ?', (username,)
+    ).fetchone()
+
+    if author is None:
+        abort(404, f"User {username!r} doesn't exist.")
+
+    if author['id'] == g.user['id']:
+        abort(400, "You can't follow yourself.")
+
+    return author['id']
+
+@bp.route('/user/<username>/follow', methods=('POST',))
+@login_required
+def follow(username):
+    follow_author(g.user['id'], get_author_id(username),
+                  author_shard(username))
+    return redirect(url_for('blog.author', username=username))
+
+@bp.route('/user/<username>/unfollow', methods=('POST',))
+@login_required
+def unfollow(username):
+    unfollow_author(g.user['id'], get_author_id(username))
+    return redirect(url_for('blog.author', username=username))
+
+@bp.route('/feed')
+@login_required
+def feed():
+    posts = get_feed_page(
+        g.user['id'], request.args.get('before'), request.args.get('after')
+    )
+    return render_template('blog/feed.html', posts=posts)
+
+def match_query(q):
+    # quote every term so user input can't use (or break) FTS5 syntax
+    return ' '.join('"{}"'.format(t.replace('"', '""')) for t in q.split())
+
+def highlight(text):
+    return (escape(text)
+            .replace('\x02', Markup('<mark>'))
+            .replace('\x03', Markup('</mark>')))
+
+@bp.route('/search')
+def search():
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['POSTS_PER_PAGE']
+    posts = []
+    has_next = False
+
+    if q:
+        offset = (page - 1) * per_page
+        shards = post_shards()
+        # each shard gives its best rows up to the end of the page, and the
+        # page is cut from all of them merged by score
+        skip = offset if len(shards) > 1 else 0
+        cursors = [get_read_db(shard).execute(
+            "SELECT p.id, highlight(post_fts, 0, char(2), char(3)) AS title,"
+            " highlight(post_fts, 1, char(2), char(3)) AS body,"
+            " p.created, p.author_id, u.username,"
+            " bm25(post_fts, 10.0, 1.0) AS score"
+            " FROM post_fts"
+            " JOIN post p ON p.id = post_fts.rowid"
+            " JOIN user u ON p.author_id = u.id"
+            " WHERE post_fts MATCH ?"
+            " ORDER BY score LIMIT ? OFFSET ?",
+            (match_query(q), skip + per_page + 1, offset - skip)
+        ) for shard in shards]
+        rows = list(itertools.islice(
+            heapq.merge(*cursors, key=itemgetter('score')),
+            skip, skip + per_page + 1
+        ))
+        has_next = len(rows) > per_page
+        posts = [
+            dict(row, title=highlight(row['title']),
+                 body=highlight(row['body']))
+            for row in rows[:per_page]
+        ]
+
+    return render_template(
+        'blog/search.html', q=q, posts=posts, page=page, has_next=has_next
+    )
+
+@bp.route('/create', methods=('GET', 'POST'))
+@login_required
+def create():
+    if request.method == 'POST':
+        title = request.form['title']
+        body = request.form['body']
+        error = None
+
+        if not title:
+            error = 'Title is required.'
+
+        if error is not None:
+            flash(error)
+        else:
+            id, shard = route_post(g.user['id'])
+            id = execute_write(
+                'INSERT INTO post'
+                ' (id, title, body, body_html, render_version, author_id)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (id, title, body, render_markdown(body), RENDER_VERSION,
+                 g.user['id']),
+                shard
+            ).lastrowid
+            if current_app.config['FEED_FANOUT_JOBS']:
+                enqueue('fan-out-post', id, g.user['id'], shard)
+            else:
+                fan_out_post(id, g.user['id'], shard)
+            get_page_cache().bump_version()
+            return redirect(url_for('blog.index'))
+
+    return render_template('blog/create.html')
+
+def get_post(id, check_author=True):
+    post = cached_row(
+        ('post', id),
+        'SELECT p.id, title, body, body_html,'
+        ' created, author_id, username'
+        ' FROM post_full p JOIN user u ON p.author_id = u.id'
+        ' WHERE p.id = ?',
+        (id,), post_shard(id)
+    )
+
+    if post is None:
+        abort(404, f"Post id {id} doesn't exist.")
+
+    if check_author and post['author_id'] != g.user['id']:
+        abort(403)
+
+    return post
+
+@bp.route('/<int:id>')
+def detail(id):
+    post = get_post(id, check_author=False)
+    return render_template('blog/post.html', post=post)
+
+@bp.route('/<int:id>/update', methods=('GET', 'POST'))
+@login_required
+def update(id):
+    post = get_post(id)
+
+    if request.method == 'POST':
+        title = request.form['title']
+        body = request.form['body']
+        error = None
+
+        if not title:
+            error = 'Title is required.'
+
+        if error is not None:
+            flash(error)
+        else:
+            execute_write(
+                # an archived post's body comes back into post
+                'UPDATE post SET title = ?, body = ?, body_html = ?,'
+                ' render_version = ?, archived = 0 WHERE id = ?',
+                (title, body, render_markdown(body), RENDER_VERSION, id),
+                post_shard(id)
+            )
+            get_row_cache().discard(('post', id))
+            get_page_cache().bump_version()
+            return redirect(url_for('blog.index'))
+
+    return render_template('blog/update.html', post=post)
+
+@bp.route('/<int:id>/delete', methods=('POST',))
+@login_required
+def delete(id):
+    get_post(id)
+    execute_write('DELETE FROM post WHERE id = ?', (id,), post_shard(id))
+    unfan_post(id)
+    unroute_post(id)
+    get_row_cache().discard(('post', id))
+    get_page_cache().bump_version()
     return redirect(url_for('blog.index'))
\ No newline at end of file
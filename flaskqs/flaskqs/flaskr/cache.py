@@ -0,0 +1,233 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app, g
+
+from flaskr.db import get_pool, get_read_db
+
+
+class PageCache:
+    """An LRU cache of rendered pages bounded by the total size of the bodies.
+
+    Every write to the database bumps the version, which drops all entries
+    at once, and the time of the last bump serves as every page's
+    Last-Modified. The ETag is the digest of the body alone, so every
+    worker process gives the same page the same ETag.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.modified = datetime.now(timezone.utc)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key, body, version):
+        """Store a page rendered at ``version`` and return (body, etag).
+
+        Pages rendered before the latest bump are not stored, since a
+        write may have landed while they were being rendered.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+        etag = hashlib.sha1(body).hexdigest()[:16]
+        entry = (body, etag)
+
+        with self._lock:
+            if version != self.version or len(body) > self.max_bytes:
+                return entry
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+
+            self._entries[key] = entry
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+        return entry
+
+    def bump_version(self):
+        with self._lock:
+            self.version += 1
+            self.modified = datetime.now(timezone.utc)
+            self._entries.clear()
+            self.size = 0
+
+
+def get_page_cache():
+    cache = current_app.extensions.get('flaskr_page_cache')
+
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'flaskr_page_cache',
+            PageCache(current_app.config['PAGE_CACHE_BYTES'])
+        )
+
+    return cache
+
+
+class RowCache:
+    """An LRU cache of single database rows that expire after ``ttl`` seconds.
+
+    ``generation`` changes whenever entries are dropped, so a row read
+    before a write is not stored after it.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, row, generation):
+        with self._lock:
+            if generation != self.generation or not self.max_entries:
+                return
+
+            self._entries[key] = (row, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+def get_row_cache():
+    cache = current_app.extensions.get('flaskr_row_cache')
+
+    if cache is None:
+        cache = current_app.extensions.setdefault('flaskr_row_cache', RowCache(
+            current_app.config['ROW_CACHE_SIZE'],
+            current_app.config['ROW_CACHE_TTL'],
+        ))
+
+    return cache
+
+
+class VersionWatch:
+    """Watches PRAGMA data_version of each database on a connection of its
+    own that never writes, so that each commit, from any connection in any
+    process, is seen once per process.
+
+    data_version only means something to the connection that read it, and
+    only changes for commits made through other connections: watching it
+    on the pooled connections instead would see every commit once per
+    connection.
+    """
+
+    def __init__(self):
+        self._watched = {}
+        self._lock = threading.Lock()
+
+    def changed(self, shard=None):
+        """Return whether anything was committed to the database of
+        ``shard`` since the last call.
+        """
+        with self._lock:
+            conn, seen = self._watched.get(shard, (None, None))
+            if conn is None:
+                conn = get_pool('read', shard).connect()
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            self._watched[shard] = (conn, version)
+            return version != seen
+
+
+def get_version_watch():
+    watch = current_app.extensions.get('flaskr_version_watch')
+
+    if watch is None:
+        watch = current_app.extensions.setdefault(
+            'flaskr_version_watch', VersionWatch()
+        )
+
+    return watch
+
+
+def sync_caches():
+    """Drop the cached rows and pages if anything was committed, whatever
+    the process, since the last request checked.
+
+    Runs once per request and costs a single PRAGMA data_version (one per
+    database when posts are sharded). A write made in this process shows
+    up here too, but only on the next request, so writers still
+    invalidate what they touch themselves.
+    """
+    if g.get('caches_synced'):
+        return
+
+    g.caches_synced = True
+    watch = get_version_watch()
+    # check every database, not just until the first change
+    changed = [
+        watch.changed(shard)
+        for shard in (None, *range(current_app.config['SHARDS']))
+    ]
+
+    if any(changed):
+        get_row_cache().clear()
+        get_page_cache().bump_version()
+
+
+def cached_row(key, query, args=(), shard=None):
+    sync_caches()
+    cache = get_row_cache()
+    row = cache.get(key)
+
+    if row is None:
+        generation = cache.generation
+        row = get_read_db(shard).execute(query, args).fetchone()
+
+        if row is not None:
+            cache.set(key, row, generation)
+
+    return row
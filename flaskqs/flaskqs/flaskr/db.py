@@ -1,45 +1,413 @@
-import sqlite3
-from datetime import datetime
-
-import click
-from flask import current_app, g
-
-
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
-
-    return g.db
-
-
-def close_db(e=None):
-    db = g.pop('db', None)
-
-    if db is not None:
-        db.close()
-
-def init_db():
-    db = get_db()
-
-    with current_app.open_resource('schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
-
-
-@click.command('init-db')
-def init_db_command():
-    """Clear the existing data and create new tables."""
-    init_db()
-    click.echo('Initialized the database.')
-
-
-sqlite3.register_converter(
-    "timestamp", lambda v: datetime.fromisoformat(v.decode())
-)
-
-def init_app(app):
-    app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app, g
+from werkzeug.exceptions import ServiceUnavailable
+
+
+# the tables only the primary database holds when posts are sharded
+PRIMARY_TABLES = (
+    'user', 'shard_map', 'post_route', 'follow', 'follow_count', 'feed_entry',
+    'job',
+)
+
+
+class PoolTimeout(ServiceUnavailable):
+    description = 'No database connection became available in time.'
+
+
+class Cursor(sqlite3.Cursor):
+    """Times the fetching of a statement's rows on top of its execute(),
+    and reports the total once the rows run out or the cursor is closed or
+    dropped, see Connection.execute().
+    """
+    sql = None
+    seconds = 0.0
+
+    def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def _report(self):
+        if self.sql is not None:
+            sql, self.sql = self.sql, None
+            self.connection.on_query(sql, self.seconds)
+
+    def __next__(self):
+        try:
+            return self._fetch(super().__next__)
+        except StopIteration:
+            self._report()
+            raise
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if row is None:
+            self._report()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._fetch(super().fetchmany, size)
+        if len(rows) < size:
+            self._report()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._report()
+        return rows
+
+    def close(self):
+        self._report()
+        super().close()
+
+    def __del__(self):
+        self._report()
+
+
+class Connection(sqlite3.Connection):
+    # called as on_query(sql, seconds) once each statement is done,
+    # including reading its rows, see flaskr.metrics
+    on_query = None
+
+    def execute(self, sql, parameters=()):
+        if self.on_query is None:
+            return super().execute(sql, parameters)
+
+        cursor = self.cursor(Cursor)
+        start = time.perf_counter()
+        try:
+            cursor.execute(sql, parameters)
+        except BaseException:
+            self.on_query(sql, time.perf_counter() - start)
+            raise
+        cursor.sql = sql
+        cursor.seconds = time.perf_counter() - start
+        if cursor.description is None:
+            # no rows to read
+            cursor._report()
+        return cursor
+
+    def executemany(self, sql, parameters):
+        if self.on_query is None:
+            return super().executemany(sql, parameters)
+
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.on_query(sql, time.perf_counter() - start)
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections shared by the request threads.
+
+    A connection is only ever used by the thread that checked it out, so
+    connections are opened with ``check_same_thread=False`` and handed
+    between threads through the idle queue. A size of 0 disables pooling
+    and opens a fresh connection for every checkout.
+
+    A ``read_only`` pool opens the file with a ``mode=ro`` URI and sets
+    ``query_only``, so its connections never take the write lock.
+
+    ``attach`` names a database attached to every connection as
+    ``primary_db``: a shard's connections see the primary's tables that the
+    shard doesn't have, such as user.
+    """
+
+    def __init__(self, database, size=5, timeout=5.0, cache_size=-16000,
+                 mmap_size=0, on_connect=(), read_only=False, attach=None):
+        self.database = database
+        self.read_only = read_only
+        self.attach = attach
+        self.size = size
+        self.timeout = timeout
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+        self.on_connect = on_connect
+        self.opened = 0
+        self.closed = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size) if size else None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        database = self._name(self.database)
+
+        conn = sqlite3.connect(
+            database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            factory=Connection,
+            uri=self.read_only,
+        )
+        conn.row_factory = sqlite3.Row
+
+        if self.read_only:
+            conn.execute('PRAGMA query_only = 1')
+        else:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = {self.cache_size}')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        if self.attach is not None:
+            conn.execute(
+                'ATTACH DATABASE ? AS primary_db', (self._name(self.attach),)
+            )
+        for hook in self.on_connect:
+            hook(conn)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        if self._slots is None:
+            return self.connect()
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout()
+
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+
+                if self._healthy(conn):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        if self._slots is None:
+            self._discard(conn)
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def _name(self, database):
+        if self.read_only:
+            return f'{pathlib.Path(database).resolve().as_uri()}?mode=ro'
+        return database
+
+    def _healthy(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self.closed += 1
+
+
+def shard_database(shard):
+    return current_app.config['SHARD_DATABASE'].format(shard)
+
+
+def post_shards():
+    """Return the shards holding posts, or [None] (the primary database)
+    when posts aren't sharded.
+    """
+    return list(range(current_app.config['SHARDS'])) or [None]
+
+
+def get_pool(role='write', shard=None):
+    """Return the pool for the ``'read'`` or ``'write'`` role, of the
+    primary database or of a shard.
+    """
+    if shard is None:
+        extensions = current_app.extensions
+        key = f'flaskr_{role}_pool'
+    else:
+        extensions = current_app.extensions.setdefault(
+            'flaskr_shard_pools', {}
+        )
+        key = (role, shard)
+    pool = extensions.get(key)
+
+    if pool is None:
+        config = current_app.config
+        read_only = role == 'read'
+        database = config['DATABASE']
+        if read_only and config['READ_DATABASE']:
+            database = config['READ_DATABASE']
+        attach = None
+        if shard is not None:
+            database, attach = shard_database(shard), database
+
+        pool = extensions.setdefault(key, ConnectionPool(
+            database,
+            size=config['DB_POOL_SIZE'],
+            timeout=config['DB_POOL_TIMEOUT'],
+            cache_size=config['DB_CACHE_SIZE'],
+            mmap_size=config['DB_MMAP_SIZE'],
+            on_connect=current_app.extensions['flaskr_on_connect'],
+            read_only=read_only,
+            attach=attach,
+        ))
+
+    return pool
+
+
+def get_shard_db(role, shard):
+    shard_dbs = g.setdefault('shard_dbs', {})
+
+    if (role, shard) not in shard_dbs:
+        shard_dbs[role, shard] = get_pool(role, shard).acquire()
+
+    return shard_dbs[role, shard]
+
+
+def get_write_db(shard=None):
+    if shard is not None:
+        return get_shard_db('write', shard)
+
+    if 'db' not in g:
+        g.db = get_pool('write').acquire()
+
+    return g.db
+
+
+def get_read_db(shard=None):
+    """Return a read-only connection, which may be on a replica of the
+    database (READ_DATABASE) and so may lag behind get_write_db().
+    """
+    if shard is not None:
+        return get_shard_db('read', shard)
+
+    if 'read_db' not in g:
+        g.read_db = get_pool('read').acquire()
+
+    return g.read_db
+
+
+# the single connection flaskr used before connections had roles
+get_db = get_write_db
+
+
+def close_db(e=None):
+    db = g.pop('db', None)
+
+    if db is not None:
+        get_pool('write').release(db)
+
+    read_db = g.pop('read_db', None)
+
+    if read_db is not None:
+        get_pool('read').release(read_db)
+
+    for (role, shard), shard_db in g.pop('shard_dbs', {}).items():
+        get_pool(role, shard).release(shard_db)
+
+
+def init_shard(database, schema):
+    # on a connection of its own: with the primary attached, dropping the
+    # shard's user table could drop the primary's
+    conn = sqlite3.connect(database)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript(schema)
+        # these live in the primary, which shard connections attach
+        for table in PRIMARY_TABLES:
+            conn.execute(f'DROP TABLE {table}')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def init_db():
+    db = get_write_db()
+
+    with current_app.open_resource('schema.sql') as f:
+        schema = f.read().decode('utf8')
+
+    db.executescript(schema)
+    for shard in range(current_app.config['SHARDS']):
+        init_shard(shard_database(shard), schema)
+
+
+@click.command('init-db')
+def init_db_command():
+    """Clear the existing data and create new tables."""
+    init_db()
+    click.echo('Initialized the database.')
+
+
+def reindex_search(shard=None):
+    db = get_write_db(shard)
+    db.execute("INSERT INTO post_fts (post_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO post_fts (post_fts) VALUES ('optimize')")
+    db.commit()
+    return db.execute('SELECT COUNT(*) FROM post').fetchone()[0]
+
+
+@click.command('reindex-search')
+def reindex_search_command():
+    """Rebuild the full-text search index, archived posts included."""
+    count = sum(reindex_search(shard) for shard in post_shards())
+    click.echo(f'Reindexed {count} posts.')
+
+
+def rebuild_user_stats(shard=None):
+    db = get_write_db(shard)
+    db.execute('DELETE FROM user_stats')
+    db.execute(
+        'INSERT INTO user_stats (user_id, post_count, last_post)'
+        ' SELECT author_id, COUNT(*), MAX(created) FROM post'
+        ' GROUP BY author_id'
+    )
+    db.commit()
+    return db.execute('SELECT COUNT(*) FROM user_stats').fetchone()[0]
+
+
+@click.command('rebuild-user-stats')
+def rebuild_user_stats_command():
+    """Recount the posts of every author into user_stats."""
+    count = sum(rebuild_user_stats(shard) for shard in post_shards())
+    click.echo(f'Rebuilt the stats of {count} authors.')
+
+
+sqlite3.register_converter(
+    "timestamp", lambda v: datetime.fromisoformat(v.decode())
+)
+
+def init_app(app):
+    # functions called with every new pooled connection
+    app.extensions['flaskr_on_connect'] = []
+    app.teardown_appcontext(close_db)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(reindex_search_command)
+    app.cli.add_command(rebuild_user_stats_command)
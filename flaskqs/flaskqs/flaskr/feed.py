@@ -0,0 +1,104 @@
+"""Following authors, and the feed of their posts each user reads.
+
+A feed is materialized in feed_entry: creating a post copies a row for
+it into the feed of every follower (fan-out on write), so reading a
+feed is one range read on feed_entry's primary key instead of a join of
+follow and post over everyone the reader follows.
+
+An author with more than FEED_FANOUT_LIMIT followers would make every
+post they write cost that many rows, so their posts are left where they
+are: the first post they write past the limit sets follow_count.pull,
+and from then on feeds leave out their entries and merge in their posts
+as the feed is read instead (fan-out on read), see
+flaskr.blog.get_feed_page.
+
+feed_entry, follow and follow_count live in the primary database. The
+statements that join them to post run on the post's shard, whose
+connections see them through ``primary_db`` (see flaskr.shards).
+"""
+from flask import current_app
+
+from flaskr.db import get_write_db
+from flaskr.jobs import job
+from flaskr.writer import execute_write
+
+
+def is_pulled(author_id):
+    """Return whether feeds read the posts of ``author_id`` from post
+    rather than from feed_entry.
+    """
+    row = get_write_db().execute(
+        'SELECT pull FROM follow_count WHERE author_id = ?', (author_id,)
+    ).fetchone()
+    return row is not None and bool(row['pull'])
+
+
+def follow_author(follower_id, author_id, shard=None):
+    """Make ``follower_id`` follow ``author_id``, whose posts are on
+    ``shard``, and copy the author's latest FEED_BACKFILL posts into the
+    follower's feed so it doesn't start out empty.
+    """
+    followed = execute_write(
+        'INSERT OR IGNORE INTO follow (follower_id, author_id) VALUES (?, ?)',
+        (follower_id, author_id)
+    ).rowcount
+
+    if followed and not is_pulled(author_id):
+        execute_write(
+            'INSERT OR IGNORE INTO feed_entry'
+            ' (user_id, created, post_id, author_id)'
+            ' SELECT ?, created, id, author_id FROM post'
+            ' WHERE author_id = ?'
+            ' ORDER BY created DESC, id DESC LIMIT ?',
+            (follower_id, author_id, current_app.config['FEED_BACKFILL']),
+            shard
+        )
+
+
+def unfollow_author(follower_id, author_id):
+    execute_write(
+        'DELETE FROM follow WHERE follower_id = ? AND author_id = ?',
+        (follower_id, author_id)
+    )
+    execute_write(
+        'DELETE FROM feed_entry WHERE user_id = ? AND author_id = ?',
+        (follower_id, author_id)
+    )
+
+
+@job('fan-out-post')
+def fan_out_post(id, author_id, shard=None):
+    """Copy the new post ``id``, on ``shard``, into the feed of every
+    follower of its author, unless the author has too many followers.
+    Runs in the request, or as a job with FEED_FANOUT_JOBS.
+    """
+    row = get_write_db().execute(
+        'SELECT followers, pull FROM follow_count WHERE author_id = ?',
+        (author_id,)
+    ).fetchone()
+
+    if row is None or row['pull']:
+        return
+
+    if row['followers'] > current_app.config['FEED_FANOUT_LIMIT']:
+        # for good: entries written before now are left out of the feeds
+        # from here on, so none of the author's posts is shown twice
+        execute_write(
+            'UPDATE follow_count SET pull = 1 WHERE author_id = ?',
+            (author_id,)
+        )
+        return
+
+    execute_write(
+        'INSERT OR IGNORE INTO feed_entry'
+        ' (user_id, created, post_id, author_id)'
+        ' SELECT f.follower_id, p.created, p.id, p.author_id'
+        ' FROM post p JOIN follow f ON f.author_id = p.author_id'
+        ' WHERE p.id = ?',
+        (id,), shard
+    )
+
+
+def unfan_post(id):
+    # after the post itself is gone, so no feed shows a missing post
+    execute_write('DELETE FROM feed_entry WHERE post_id = ?', (id,))
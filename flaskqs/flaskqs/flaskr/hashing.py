@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(ServiceUnavailable):
+    description = 'Too many logins in progress, please try again shortly.'
+
+
+class HashingPool:
+    """Runs password hashing in worker processes so that a burst of logins
+    can't hold every request thread on CPU-bound work.
+
+    At most ``max_pending`` hashes may be queued or running; beyond that
+    callers get HashingBusy straight away instead of waiting in line. With
+    ``workers=0`` hashing runs inline on the request thread.
+    """
+
+    def __init__(self, workers, max_pending, retry_after=1):
+        self.workers = workers
+        self.retry_after = retry_after
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        if self.workers == 0:
+            return fn(*args)
+
+        if not self._pending.acquire(blocking=False):
+            raise HashingBusy(retry_after=self.retry_after)
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+
+        future.add_done_callback(lambda f: self._pending.release())
+        return future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the server has threads running
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+
+def get_hashing_pool():
+    pool = current_app.extensions.get('flaskr_hashing')
+
+    if pool is None:
+        config = current_app.config
+        workers = config['HASH_WORKERS']
+        if workers is None:
+            workers = os.cpu_count() or 1
+        pool = current_app.extensions.setdefault('flaskr_hashing', HashingPool(
+            workers,
+            config['HASH_MAX_PENDING'],
+            config['HASH_RETRY_AFTER'],
+        ))
+
+    return pool
+
+
+def hash_password(password):
+    return get_hashing_pool().run(
+        generate_password_hash, password,
+        current_app.config['PASSWORD_HASH_METHOD']
+    )
+
+
+def check_password(pwhash, password):
+    return get_hashing_pool().run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    return pwhash.split('$', 1)[0] != current_app.config['PASSWORD_HASH_METHOD']
@@ -0,0 +1,241 @@
+"""A job queue in the database: views enqueue() work and return, and
+``flask worker`` runs it in the background.
+
+A job is a row of the job table naming a function registered with
+``@job`` and the JSON list of its arguments. Workers claim the jobs that
+are due with one UPDATE ... RETURNING, so no two workers (or worker
+processes) ever run the same job, and run them on a pool of threads or
+processes, each in an app context of its own.
+
+A job that raises is queued again JOB_RETRY_DELAY seconds later, the
+delay doubling with every attempt, and is left failed after
+JOB_MAX_ATTEMPTS attempts. A job still running JOB_TIMEOUT seconds after
+it was claimed, as when its worker was killed, counts as a failed
+attempt too.
+"""
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+
+import click
+from flask import current_app
+
+from flaskr.db import get_pool
+from flaskr.writer import execute_write
+
+# the functions jobs may name, see job()
+JOBS = {}
+
+# the app each worker process runs its jobs in, see start_process()
+process_app = None
+
+
+def job(name):
+    """Register the decorated function as the job ``name``. It is called
+    in an app context with the arguments given to enqueue().
+    """
+    def register(f):
+        JOBS[name] = f
+        return f
+
+    return register
+
+
+def enqueue(name, *args, delay=0):
+    """Queue the job ``name`` to run ``delay`` seconds from now and return
+    its id; ``args`` must be JSON serializable.
+    """
+    if name not in JOBS:
+        raise ValueError(f'Unknown job {name!r}.')
+
+    return execute_write(
+        'INSERT INTO job (name, args, run_at) VALUES (?, ?, ?)',
+        (name, json.dumps(args), time.time() + delay)
+    ).lastrowid
+
+
+def queue_depth(db):
+    """Return the number of jobs in each state."""
+    counts = dict.fromkeys(('queued', 'running', 'failed'), 0)
+    counts.update(
+        db.execute('SELECT state, COUNT(*) FROM job GROUP BY state')
+    )
+    return counts
+
+
+def start_process(config):
+    global process_app
+    from flaskr import create_app
+    process_app = create_app(config)
+
+
+def run_job(name, args, app=None):
+    with (app or process_app).app_context():
+        JOBS[name](*args)
+
+
+class Worker:
+    """Claims due jobs, as many as there are free threads or processes in
+    its pool, and records how each one went.
+
+    Only the thread calling run() touches the database, on a connection
+    of its own; the jobs open theirs through the app as usual.
+    """
+
+    def __init__(self, app, workers=4, processes=False):
+        self.app = app
+        self.workers = workers
+        self.processes = processes
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.stopping = threading.Event()
+
+    def claim(self, db, limit):
+        config = self.app.config
+        now = time.time()
+        # the jobs of a worker that died go back to the queue first
+        db.execute(
+            "UPDATE job SET error = 'Timed out.',"
+            " state = iif(attempts >= ?, 'failed', 'queued'), run_at = ?"
+            " WHERE state = 'running' AND claimed_at <= ?",
+            (config['JOB_MAX_ATTEMPTS'], now, now - config['JOB_TIMEOUT'])
+        )
+        jobs = db.execute(
+            "UPDATE job SET state = 'running', attempts = attempts + 1,"
+            ' claimed_at = ?'
+            ' WHERE id IN (SELECT id FROM job'
+            " WHERE state = 'queued' AND run_at <= ?"
+            ' ORDER BY run_at, id LIMIT ?)'
+            ' RETURNING id, name, args, attempts',
+            (now, now, limit)
+        ).fetchall()
+        db.commit()
+        return jobs
+
+    def finish(self, db, job, error):
+        config = self.app.config
+
+        if error is None:
+            db.execute('DELETE FROM job WHERE id = ?', (job['id'],))
+            self.done += 1
+        else:
+            self.app.logger.warning(
+                'Job %s (%s) failed: %r', job['id'], job['name'], error
+            )
+            attempts = job['attempts']
+            if attempts < config['JOB_MAX_ATTEMPTS']:
+                delay = config['JOB_RETRY_DELAY'] * 2 ** (attempts - 1)
+                self.retried += 1
+            else:
+                delay = 0
+                self.failed += 1
+            db.execute(
+                'UPDATE job SET'
+                " state = iif(attempts >= ?, 'failed', 'queued'),"
+                ' run_at = ?, error = ? WHERE id = ?',
+                (config['JOB_MAX_ATTEMPTS'], time.time() + delay,
+                 repr(error), job['id'])
+            )
+
+        db.commit()
+
+    def run(self, once=False, report=None):
+        """Run jobs until stop() is called or, with ``once``, until none
+        are due. ``report`` is called with the queue_depth() and the
+        worker itself every JOB_REPORT_INTERVAL seconds.
+        """
+        config = self.app.config
+        if self.processes:
+            # spawn rather than fork: the app may have threads running
+            executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=start_process, initargs=(dict(config),)
+            )
+        else:
+            executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix='flaskr-job'
+            )
+        with self.app.app_context():
+            db = get_pool('write').connect()
+        running = {}
+        reported = time.monotonic()
+
+        try:
+            while running or not self.stopping.is_set():
+                if not self.stopping.is_set():
+                    for job in self.claim(db, self.workers - len(running)):
+                        args = [job['name'], json.loads(job['args'])]
+                        if not self.processes:
+                            args.append(self.app)
+                        running[executor.submit(run_job, *args)] = job
+
+                if running:
+                    finished, _ = wait(running, config['JOB_POLL_INTERVAL'],
+                                       return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        job = running.pop(future)
+                        self.finish(db, job, future.exception())
+                elif once:
+                    break
+                else:
+                    self.stopping.wait(config['JOB_POLL_INTERVAL'])
+
+                if (report is not None and time.monotonic() - reported
+                        >= config['JOB_REPORT_INTERVAL']):
+                    report(queue_depth(db), self)
+                    reported = time.monotonic()
+        finally:
+            executor.shutdown()
+            db.close()
+
+    def stop(self):
+        # let the running jobs finish, but claim no more
+        self.stopping.set()
+
+
+@click.command('worker')
+@click.option('--workers', type=int, default=None,
+              help='Jobs run at once (default: JOB_WORKERS).')
+@click.option('--processes/--threads', default=None,
+              help='Run the jobs in processes or threads (default:'
+                   ' JOB_PROCESSES).')
+@click.option('--once', is_flag=True,
+              help='Exit once no job is due rather than wait for more.')
+def worker_command(workers, processes, once):
+    """Run the queued background jobs."""
+    config = current_app.config
+    if workers is None:
+        workers = config['JOB_WORKERS'] or os.cpu_count() or 1
+    if processes is None:
+        processes = config['JOB_PROCESSES']
+    worker = Worker(current_app._get_current_object(), workers, processes)
+
+    def report(depth, worker):
+        click.echo(
+            f"queued {depth['queued']}, running {depth['running']},"
+            f" failed {depth['failed']}; this worker: {worker.done} done,"
+            f' {worker.retried} retried, {worker.failed} failed'
+        )
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: worker.stop())
+
+    kind = 'processes' if processes else 'threads'
+    click.echo(f'Running jobs on {workers} {kind}.')
+    worker.run(once, report)
+    db = get_pool('write').connect()
+    try:
+        report(queue_depth(db), worker)
+    finally:
+        db.close()
+
+
+def init_app(app):
+    app.cli.add_command(worker_command)
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_app_context, request
+
+from flaskr.cache import get_page_cache, get_row_cache
+from flaskr.db import get_pool, get_read_db
+from flaskr.jobs import queue_depth
+from flaskr.ratelimit import get_limiter
+
+
+class Histogram:
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+               2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms for this process, shown at /metrics."""
+
+    def __init__(self):
+        self.requests = defaultdict(Histogram)
+        self.queries = defaultdict(int)
+        self.query_time = defaultdict(float)
+        self.query_duration = Histogram()
+        self.slow_queries = 0
+        self.lock = threading.Lock()
+
+    def observe_request(self, endpoint, seconds, queries, query_time):
+        with self.lock:
+            self.requests[endpoint].observe(seconds)
+            self.queries[endpoint] += queries
+            self.query_time[endpoint] += query_time
+
+    def observe_query(self, seconds, slow):
+        with self.lock:
+            self.query_duration.observe(seconds)
+            self.slow_queries += slow
+
+
+def get_metrics():
+    return current_app.extensions['flaskr_metrics']
+
+
+def instrument(app):
+    """Return the on-connect hook that counts and times every statement
+    run on a pooled connection, up to its last row, logging those slower
+    than SLOW_QUERY_MS.
+    """
+    metrics = app.extensions['flaskr_metrics']
+
+    def trace(sql):
+        # statements run by triggers are reported as comments
+        if has_app_context() and 'query_count' in g \
+                and not sql.startswith('--'):
+            g.query_count += 1
+
+    def on_query(sql, seconds):
+        threshold = app.config['SLOW_QUERY_MS']
+        slow = threshold is not None and seconds * 1000 >= threshold
+        metrics.observe_query(seconds, slow)
+
+        if has_app_context() and 'query_time' in g:
+            g.query_time += seconds
+
+        if slow:
+            app.logger.warning('Slow query (%.1f ms): %s', seconds * 1000, sql)
+
+    def hook(conn):
+        conn.set_trace_callback(trace)
+        conn.on_query = on_query
+
+    return hook
+
+
+def start_request():
+    g.request_started = time.perf_counter()
+    g.request_endpoint = request.endpoint or '<unmatched>'
+    g.query_count = 0
+    g.query_time = 0.0
+
+
+def finish_request(e=None):
+    started = g.pop('request_started', None)
+
+    if started is not None:
+        get_metrics().observe_request(
+            g.request_endpoint, time.perf_counter() - started,
+            g.query_count, g.query_time
+        )
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_histogram(lines, name, histogram, labels=''):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+    labels = f'{{{labels.rstrip(",")}}}' if labels else ''
+    lines.append(f'{name}_sum{labels} {histogram.sum}')
+    lines.append(f'{name}_count{labels} {histogram.count}')
+
+
+def render(metrics, pools, page_cache, row_cache, limiter, jobs):
+    lines = []
+
+    def header(name, kind, help):
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    with metrics.lock:
+        header('flaskr_request_duration_seconds', 'histogram',
+               'Request latency by endpoint.')
+        for endpoint, histogram in sorted(metrics.requests.items()):
+            render_histogram(lines, 'flaskr_request_duration_seconds',
+                             histogram, f'endpoint="{escape(endpoint)}",')
+
+        header('flaskr_db_queries_total', 'counter',
+               'SQL statements run, by endpoint.')
+        for endpoint, count in sorted(metrics.queries.items()):
+            lines.append(
+                f'flaskr_db_queries_total{{endpoint="{escape(endpoint)}"}}'
+                f' {count}'
+            )
+
+        header('flaskr_db_query_seconds_total', 'counter',
+               'Time spent executing SQL, by endpoint.')
+        for endpoint, seconds in sorted(metrics.query_time.items()):
+            lines.append(
+                f'flaskr_db_query_seconds_total'
+                f'{{endpoint="{escape(endpoint)}"}} {seconds}'
+            )
+
+        header('flaskr_db_query_duration_seconds', 'histogram',
+               'Time to execute a single SQL statement.')
+        render_histogram(lines, 'flaskr_db_query_duration_seconds',
+                         metrics.query_duration)
+
+        header('flaskr_db_slow_queries_total', 'counter',
+               'Statements slower than SLOW_QUERY_MS.')
+        lines.append(f'flaskr_db_slow_queries_total {metrics.slow_queries}')
+
+    for name, help, attr in (
+        ('flaskr_db_connections_opened_total',
+         'Database connections opened.', 'opened'),
+        ('flaskr_db_connections_closed_total',
+         'Database connections closed.', 'closed'),
+    ):
+        header(name, 'counter', help)
+        for role, pool in sorted(pools.items()):
+            lines.append(f'{name}{{role="{role}"}} {getattr(pool, attr)}')
+
+    for name, kind, help, value in (
+        ('flaskr_page_cache_hits_total', 'counter',
+         'Rendered pages served from the cache.', page_cache.hits),
+        ('flaskr_page_cache_misses_total', 'counter',
+         'Rendered pages not found in the cache.', page_cache.misses),
+        ('flaskr_page_cache_bytes', 'gauge',
+         'Size of the cached pages.', page_cache.size),
+        ('flaskr_row_cache_hits_total', 'counter',
+         'Rows served from the cache.', row_cache.hits),
+        ('flaskr_row_cache_misses_total', 'counter',
+         'Rows not found in the cache.', row_cache.misses),
+    ):
+        header(name, kind, help)
+        lines.append(f'{name} {value}')
+
+    for name, help, counts in (
+        ('flaskr_rate_limit_allowed_total',
+         'Auth attempts let through, by limit.', limiter.allowed),
+        ('flaskr_rate_limit_rejected_total',
+         'Auth attempts rejected with a 429, by limit.', limiter.rejected),
+    ):
+        header(name, 'counter', help)
+        for limit, count in sorted(counts.items()):
+            lines.append(f'{name}{{limit="{limit}"}} {count}')
+
+    for name, kind, help, value in (
+        ('flaskr_rate_limit_buckets', 'gauge',
+         'Rate-limit buckets not yet full.', len(limiter.buckets)),
+        ('flaskr_rate_limit_evictions_total', 'counter',
+         'Full rate-limit buckets evicted.', limiter.buckets.evictions),
+    ):
+        header(name, kind, help)
+        lines.append(f'{name} {value}')
+
+    header('flaskr_jobs', 'gauge', 'Background jobs, by state.')
+    for state, count in sorted(jobs.items()):
+        lines.append(f'flaskr_jobs{{state="{state}"}} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    pools = {role: get_pool(role) for role in ('read', 'write')}
+    body = render(get_metrics(), pools, get_page_cache(), get_row_cache(),
+                  get_limiter(), queue_depth(get_read_db()))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.extensions['flaskr_metrics'] = Metrics()
+    app.extensions['flaskr_on_connect'].append(instrument(app))
+    app.before_request(start_request)
+    app.teardown_appcontext(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,152 @@
+import ast
+import importlib
+import random
+import re
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+
+from flaskr.archive import register_functions
+
+# the modules behind the blueprints, whose SQL runs on every request
+MODULES = ('flaskr.auth', 'flaskr.blog', 'flaskr.api', 'flaskr.feed')
+
+Statement = namedtuple('Statement', 'module line sql')
+Plan = namedtuple('Plan', 'statement steps scans')
+
+# the statements worth planning; INSERT ... VALUES never reads a table
+CHECKED = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+
+def collect_statements(modules=MODULES):
+    """Return every SQL string literal passed to a call in ``modules``."""
+    statements = []
+
+    for name in modules:
+        module = importlib.import_module(name)
+        with open(module.__file__, encoding='utf8') as f:
+            tree = ast.parse(f.read(), module.__file__)
+
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call):
+                continue
+            for arg in node.args:
+                if (isinstance(arg, ast.Constant) and isinstance(arg.value, str)
+                        and CHECKED.match(arg.value)):
+                    statements.append(Statement(name, arg.lineno, arg.value))
+
+    return sorted(statements, key=lambda s: (s.module, s.line))
+
+
+def is_full_scan(step):
+    # "SCAN t USING INDEX i" walks an index in order (and is cut short by
+    # LIMIT) and virtual tables plan for themselves
+    return (step.startswith('SCAN ') and step != 'SCAN CONSTANT ROW'
+            and ' USING ' not in step and ' VIRTUAL TABLE' not in step)
+
+
+def count_parameters(sql):
+    # only placeholders outside of string literals are parameters
+    return re.sub(r"'[^']*'|\"[^\"]*\"", '', sql).count('?')
+
+
+def explain(db, statement):
+    sql = statement.sql
+    steps = [
+        row[3] for row in db.execute(
+            f'EXPLAIN QUERY PLAN {sql}', (None,) * count_parameters(sql)
+        )
+    ]
+    scans = [step for step in steps if is_full_scan(step)]
+    return Plan(statement, steps, scans)
+
+
+def check_query_plans(db, statements=None):
+    """Return the Plan of every statement, see ``Plan.scans`` for the
+    steps that read a whole table.
+    """
+    if statements is None:
+        statements = collect_statements()
+
+    return [explain(db, statement) for statement in statements]
+
+
+def connect(database, **kwargs):
+    # with the SQL functions the schema and the statements call, but none
+    # of the other connection hooks: the metrics would log the seeding
+    # as slow queries
+    db = sqlite3.connect(database, **kwargs)
+    register_functions(db)
+    return db
+
+
+def seeded_database(users=50, posts=2000, rng=None):
+    """Return an in-memory database with the schema and some sample rows,
+    analyzed so the planner sees realistic table sizes.
+    """
+    rng = rng or random.Random(0)
+    db = connect(':memory:')
+
+    with current_app.open_resource('schema.sql') as f:
+        db.executescript(f.read().decode('utf8'))
+
+    db.executemany(
+        'INSERT INTO user (username, password) VALUES (?, ?)',
+        ((f'user{i}', 'x') for i in range(users))
+    )
+    start = datetime(2024, 1, 1)
+    db.executemany(
+        'INSERT INTO post (author_id, created, title, body) VALUES (?, ?, ?, ?)',
+        ((rng.randint(1, users), (start + timedelta(minutes=i)).isoformat(' '),
+          f'post {i}', 'lorem ipsum dolor sit amet') for i in range(posts))
+    )
+    db.execute('ANALYZE')
+    db.commit()
+    return db
+
+
+def report(plans):
+    lines = []
+
+    for plan in plans:
+        statement = plan.statement
+        status = 'SCAN' if plan.scans else 'ok'
+        lines.append(f'{status:4} {statement.module}:{statement.line}')
+        lines.append(f'     {" ".join(statement.sql.split())}')
+        for step in plan.steps:
+            marker = '!' if step in plan.scans else ' '
+            lines.append(f'   {marker} {step}')
+
+    return '\n'.join(lines)
+
+
+@click.command('check-query-plans')
+@click.option('--database', type=click.Path(exists=True, dir_okay=False),
+              help='Plan against this database instead of a seeded one.')
+@click.option('--verbose', '-v', is_flag=True,
+              help='Show the plans of the statements that passed too.')
+def check_query_plans_command(database, verbose):
+    """Fail if any blueprint SQL reads a whole table."""
+    if database:
+        db = connect(f'file:{database}?mode=ro', uri=True)
+    else:
+        db = seeded_database()
+
+    plans = check_query_plans(db)
+    db.close()
+
+    failed = [plan for plan in plans if plan.scans]
+    shown = plans if verbose else failed
+    if shown:
+        click.echo(report(shown))
+    click.echo(f'{len(plans)} statements checked, {len(failed)} full scans.')
+
+    if failed:
+        raise SystemExit(1)
+
+
+def init_app(app):
+    app.cli.add_command(check_query_plans_command)
@@ -0,0 +1,206 @@
+"""Token buckets limiting login and registration attempts, per client IP
+and per username, checked before the request touches the database or
+hashes a password.
+
+A bucket is stored as a single number, the time at which it will be
+full again (the "theoretical arrival time" of GCRA, the token bucket's
+scheduling form): a limit of (burst, interval) lets a request through
+when that time, pushed ``interval`` seconds further, is at most
+``burst * interval`` seconds ahead. A bucket whose time has passed is
+full, holds no information and is evicted.
+
+Buckets live in this process's memory, or, with AUTH_RATE_LIMIT_DATABASE,
+in a SQLite table all the workers share.
+"""
+import math
+import threading
+import time
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+
+from flaskr.db import ConnectionPool
+
+# the endpoints whose POSTs are limited
+LIMITED = ('auth.login', 'auth.register')
+
+
+class RateLimited(TooManyRequests):
+    description = 'Too many attempts, please try again later.'
+
+
+class MemoryBuckets:
+    """Buckets spread over ``shards`` dicts with a lock each, so that
+    concurrent requests seldom wait on one another.
+    """
+
+    def __init__(self, shards=16, evict_interval=60.0):
+        self.evict_interval = evict_interval
+        self.evictions = 0
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._evicted = [time.monotonic()] * shards
+
+    def __len__(self):
+        return sum(len(buckets) for buckets, _ in self._shards)
+
+    def take(self, key, burst, interval):
+        """Take a token from the bucket ``key``, returning 0 if there was
+        one or else the seconds until there will be.
+        """
+        now = time.monotonic()
+        n = hash(key) % len(self._shards)
+        buckets, lock = self._shards[n]
+
+        with lock:
+            if now - self._evicted[n] >= self.evict_interval:
+                self._evict(buckets, now)
+                self._evicted[n] = now
+
+            tat = max(buckets.get(key, now), now) + interval
+            wait = tat - now - burst * interval
+            if wait > 0:
+                return wait
+            buckets[key] = tat
+            return 0
+
+    def _evict(self, buckets, now):
+        full = [key for key, tat in buckets.items() if tat <= now]
+        for key in full:
+            del buckets[key]
+        self.evictions += len(full)
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite table, taken from with one atomic statement."""
+
+    def __init__(self, database, size=5, evict_interval=60.0):
+        self.pool = ConnectionPool(database, size=size)
+        self.evict_interval = evict_interval
+        self.evictions = 0
+        self._evicted = 0.0
+        self._lock = threading.Lock()
+
+        conn = self.pool.acquire()
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limit'
+                ' (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID'
+            )
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+    def __len__(self):
+        conn = self.pool.acquire()
+        try:
+            query = 'SELECT COUNT(*) FROM rate_limit'
+            return conn.execute(query).fetchone()[0]
+        finally:
+            self.pool.release(conn)
+
+    def take(self, key, burst, interval):
+        # wall-clock time, since the table outlives processes
+        now = time.time()
+        conn = self.pool.acquire()
+
+        try:
+            with self._lock:
+                evict = now - self._evicted >= self.evict_interval
+                if evict:
+                    self._evicted = now
+            if evict:
+                self.evictions += conn.execute(
+                    'DELETE FROM rate_limit WHERE tat <= ?', (now,)
+                ).rowcount
+
+            # the update is skipped, and no row returned, when the bucket
+            # is empty
+            taken = conn.execute(
+                'INSERT INTO rate_limit (key, tat)'
+                ' VALUES (:key, :now + :interval)'
+                ' ON CONFLICT (key) DO UPDATE SET'
+                ' tat = max(tat, :now) + :interval'
+                ' WHERE max(tat, :now) - :now <= (:burst - 1) * :interval'
+                ' RETURNING tat',
+                {'key': key, 'now': now, 'burst': burst, 'interval': interval}
+            ).fetchone()
+            conn.commit()
+
+            if taken is not None:
+                return 0
+
+            tat = conn.execute(
+                'SELECT tat FROM rate_limit WHERE key = ?', (key,)
+            ).fetchone()[0]
+            return max(tat, now) + interval - now - burst * interval
+        finally:
+            self.pool.release(conn)
+
+
+class RateLimiter:
+    """Applies each configured limit to its own key of the request, and
+    counts what got through and what didn't, by limit.
+    """
+
+    def __init__(self, buckets, limits):
+        self.buckets = buckets
+        self.limits = {name: limit for name, limit in limits.items() if limit}
+        self.allowed = dict.fromkeys(self.limits, 0)
+        self.rejected = dict.fromkeys(self.limits, 0)
+        self._lock = threading.Lock()
+
+    def check(self, keys):
+        """Take a token for each of ``keys`` ({limit name: key}), raising
+        RateLimited if any bucket is empty.
+        """
+        for name, key in keys.items():
+            if name not in self.limits or not key:
+                continue
+
+            burst, interval = self.limits[name]
+            wait = self.buckets.take(f'{name}:{key}', burst, interval)
+            with self._lock:
+                if wait:
+                    self.rejected[name] += 1
+                else:
+                    self.allowed[name] += 1
+            if wait:
+                raise RateLimited(retry_after=math.ceil(wait))
+
+
+def get_limiter():
+    limiter = current_app.extensions.get('flaskr_rate_limiter')
+
+    if limiter is None:
+        config = current_app.config
+        if config['AUTH_RATE_LIMIT_DATABASE']:
+            buckets = SQLiteBuckets(
+                config['AUTH_RATE_LIMIT_DATABASE'], config['DB_POOL_SIZE']
+            )
+        else:
+            buckets = MemoryBuckets()
+        limiter = current_app.extensions.setdefault(
+            'flaskr_rate_limiter',
+            RateLimiter(buckets, {
+                'ip': config['AUTH_RATE_LIMIT_IP'],
+                'username': config['AUTH_RATE_LIMIT_USERNAME'],
+            })
+        )
+
+    return limiter
+
+
+def limit_auth():
+    if request.method != 'POST' or request.endpoint not in LIMITED:
+        return
+
+    get_limiter().check({
+        'ip': request.remote_addr,
+        'username': request.form.get('username'),
+    })
+
+
+def init_app(app):
+    # an app-wide hook, registered ahead of the auth blueprint's, so that
+    # it runs before anything loads the logged-in user
+    app.before_request(limit_auth)
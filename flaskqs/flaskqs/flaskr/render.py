@@ -0,0 +1,224 @@
+"""Markdown post bodies, rendered to HTML once when a post is written.
+
+The renderer handles a small, safe subset of Markdown: paragraphs (with
+single newlines kept as line breaks), ``#`` headings, ``>`` quotes,
+``-``/``1.`` lists, fenced code blocks, `code`, **strong**, *emphasis*
+and [links](https://example.com). All text is escaped before any markup
+is added, so a body can't inject HTML; links only keep safe schemes.
+
+Bump RENDER_VERSION whenever the output changes, then run
+``flask rerender-posts`` to bring the stored HTML up to date.
+"""
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from markupsafe import escape
+
+from flaskr.db import get_write_db, post_shards
+
+RENDER_VERSION = 1
+
+HEADING = re.compile(r'(#{1,6})\s+(.*?)\s*#*$')
+BULLET = re.compile(r'\s*[-*+]\s+(.*)')
+NUMBERED = re.compile(r'\s*\d+[.)]\s+(.*)')
+QUOTE = re.compile(r'\s*>\s?(.*)')
+FENCE = re.compile(r'\s*```')
+CODE_SPAN = re.compile(r'(`+)(.+?)\1')
+LINK = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+STRONG = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+EMPHASIS = re.compile(r'(?<![\w*])[*_](?=\S)(.+?)(?<=\S)[*_](?![\w*])')
+SAFE_URL = re.compile(r'(https?:|mailto:|/|#)', re.IGNORECASE)
+
+
+def render_inline(text):
+    """Render the inline markup of one line of text."""
+    parts = []
+
+    # code spans are taken out first so nothing inside them is markup
+    for i, part in enumerate(CODE_SPAN.split(text)):
+        if i % 3 == 2:
+            parts.append(f'<code>{escape(part.strip())}</code>')
+        elif i % 3 == 0:
+            parts.append(render_links(part))
+
+    return ''.join(parts)
+
+
+def render_links(text):
+    parts = []
+    pos = 0
+
+    for match in LINK.finditer(text):
+        label, url = match.groups()
+        parts.append(render_emphasis(text[pos:match.start()]))
+        if SAFE_URL.match(url):
+            parts.append(f'<a href="{escape(url)}" rel="nofollow">'
+                         f'{render_emphasis(label)}</a>')
+        else:
+            parts.append(render_emphasis(match.group(0)))
+        pos = match.end()
+
+    parts.append(render_emphasis(text[pos:]))
+    return ''.join(parts)
+
+
+def render_emphasis(text):
+    html = str(escape(text))
+    html = STRONG.sub(r'<strong>\1</strong>', html)
+    return EMPHASIS.sub(r'<em>\1</em>', html)
+
+
+def render_lines(lines):
+    return '<br>'.join(render_inline(line) for line in lines)
+
+
+def render_markdown(text):
+    """Return the HTML for a Markdown post body."""
+    html = []
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    i = 0
+
+    def take(pattern):
+        # the matched group of each of the lines matching pattern from i
+        nonlocal i
+        taken = []
+        while i < len(lines):
+            match = pattern.match(lines[i])
+            if match is None:
+                break
+            taken.append(match.group(1))
+            i += 1
+        return taken
+
+    while i < len(lines):
+        line = lines[i]
+
+        if not line.strip():
+            i += 1
+        elif FENCE.match(line):
+            i += 1
+            code = []
+            while i < len(lines) and not FENCE.match(lines[i]):
+                code.append(lines[i])
+                i += 1
+            i += 1
+            code = escape('\n'.join(code))
+            html.append(f'<pre><code>{code}</code></pre>')
+        elif match := HEADING.match(line):
+            tag = f'h{len(match.group(1))}'
+            html.append(f'<{tag}>{render_inline(match.group(2))}</{tag}>')
+            i += 1
+        elif QUOTE.match(line):
+            quoted = render_markdown('\n'.join(take(QUOTE)))
+            html.append(f'<blockquote>{quoted}</blockquote>')
+        elif BULLET.match(line) or NUMBERED.match(line):
+            tag = 'ul' if BULLET.match(line) else 'ol'
+            items = take(BULLET if tag == 'ul' else NUMBERED)
+            html.append(f'<{tag}>' + ''.join(
+                f'<li>{render_inline(item)}</li>' for item in items
+            ) + f'</{tag}>')
+        else:
+            paragraph = []
+            while i < len(lines) and lines[i].strip() and not (
+                FENCE.match(lines[i]) or HEADING.match(lines[i])
+                or QUOTE.match(lines[i])
+                or BULLET.match(lines[i]) or NUMBERED.match(lines[i])
+            ):
+                paragraph.append(lines[i].strip())
+                i += 1
+            html.append(f'<p>{render_lines(paragraph)}</p>')
+
+    return ''.join(html)
+
+
+def render_batch(bodies):
+    return [render_markdown(body) for body in bodies]
+
+
+def rerender_posts(workers=None, batch_size=1000, shard=None):
+    """Render the posts whose HTML is older than RENDER_VERSION, batch by
+    batch, over ``workers`` processes (None: one per CPU, 0: inline).
+    Archived posts are read from and written back to post_archive.
+    """
+    db = get_write_db(shard)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers:
+        # spawn rather than fork: the app may have threads running
+        executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn')
+        )
+    last = 0
+    count = 0
+
+    try:
+        while True:
+            batch = db.execute(
+                'SELECT id, body, archived'
+                ' FROM post_full WHERE id > ? AND render_version < ?'
+                ' ORDER BY id LIMIT ?',
+                (last, RENDER_VERSION, batch_size)
+            ).fetchall()
+
+            if not batch:
+                break
+
+            bodies = [row['body'] for row in batch]
+            if executor is None:
+                rendered = render_batch(bodies)
+            else:
+                # one task per worker, not per post
+                size = -(-len(bodies) // workers)
+                rendered = [html for chunk in executor.map(render_batch, [
+                    bodies[n:n + size] for n in range(0, len(bodies), size)
+                ]) for html in chunk]
+
+            rows = list(zip(batch, rendered))
+            archived = [(html, row['id']) for row, html in rows
+                        if row['archived']]
+            db.executemany(
+                'UPDATE post SET body_html = ?, render_version = ?'
+                ' WHERE id = ?',
+                [(html, RENDER_VERSION, row['id']) for row, html in rows
+                 if not row['archived']]
+            )
+            db.executemany(
+                'UPDATE post_archive SET body_html = deflate(?) WHERE id = ?',
+                archived
+            )
+            db.executemany(
+                'UPDATE post SET render_version = ? WHERE id = ?',
+                [(RENDER_VERSION, id) for _, id in archived]
+            )
+            db.commit()
+            count += len(batch)
+            last = batch[-1]['id']
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return count
+
+
+@click.command('rerender-posts')
+@click.option('--workers', type=int, default=None,
+              help='Rendering processes (default: one per CPU, 0: inline).')
+@click.option('--batch-size', type=int, default=1000, show_default=True,
+              help='Posts per transaction.')
+def rerender_posts_command(workers, batch_size):
+    """Re-render the posts whose HTML predates the current renderer."""
+    start = time.perf_counter()
+    count = sum(
+        rerender_posts(workers, batch_size, shard) for shard in post_shards()
+    )
+    click.echo(f'Rendered {count} posts in {time.perf_counter() - start:.2f}s'
+               f' (render version {RENDER_VERSION}).')
+
+
+def init_app(app):
+    app.cli.add_command(rerender_posts_command)
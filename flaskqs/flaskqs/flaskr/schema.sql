@@ -1,17 +1,194 @@
-DROP TABLE IF EXISTS user;
-DROP TABLE IF EXISTS post;
-
-CREATE TABLE user (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  username TEXT UNIQUE NOT NULL,
-  password TEXT NOT NULL
-);
-
-CREATE TABLE post (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  author_id INTEGER NOT NULL,
-  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  title TEXT NOT NULL,
-  body TEXT NOT NULL,
-  FOREIGN KEY (author_id) REFERENCES user (id)
-);
\ No newline at end of file
+DROP TABLE IF EXISTS job;
+DROP TABLE IF EXISTS feed_entry;
+DROP TABLE IF EXISTS follow_count;
+DROP TABLE IF EXISTS follow;
+DROP TABLE IF EXISTS post_route;
+DROP TABLE IF EXISTS shard_map;
+DROP TABLE IF EXISTS post_fts;
+DROP VIEW IF EXISTS post_full;
+DROP TABLE IF EXISTS user_stats;
+DROP TABLE IF EXISTS post_archive;
+DROP TABLE IF EXISTS user;
+DROP TABLE IF EXISTS post;
+
+CREATE TABLE user (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL
+);
+
+CREATE TABLE post (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  title TEXT NOT NULL,
+  body TEXT NOT NULL,
+  -- body rendered from Markdown by flaskr.render at this version
+  body_html TEXT NOT NULL DEFAULT '',
+  render_version INTEGER NOT NULL DEFAULT 0,
+  -- the body is in post_archive (see flaskr.archive), and the one here is
+  -- empty; an edit of the body has to clear this
+  archived INTEGER NOT NULL DEFAULT 0 CHECK (NOT archived OR body = ''),
+  FOREIGN KEY (author_id) REFERENCES user (id)
+);
+
+CREATE INDEX post_created_idx ON post (created, id);
+CREATE INDEX post_author_created_idx ON post (author_id, created, id);
+
+-- zlib-compressed bodies of the archived posts, whose body and body_html
+-- in post are left empty (see flaskr.archive)
+CREATE TABLE post_archive (
+  id INTEGER PRIMARY KEY,
+  body BLOB NOT NULL,
+  body_html BLOB NOT NULL,
+  FOREIGN KEY (id) REFERENCES post (id)
+);
+
+-- every post with its body, archived or not: read posts through this
+-- rather than post. post_archive is only looked up for archived posts,
+-- whose bodies are inflate()d, a function only the app's connections have
+CREATE VIEW post_full AS
+  SELECT id, author_id, created, title,
+    iif(archived, (SELECT inflate(a.body) FROM post_archive a
+      WHERE a.id = post.id), body) AS body,
+    iif(archived, (SELECT inflate(a.body_html) FROM post_archive a
+      WHERE a.id = post.id), body_html) AS body_html,
+    render_version, archived
+  FROM post;
+
+-- per-author totals, kept in step by the triggers below
+CREATE TABLE user_stats (
+  user_id INTEGER PRIMARY KEY,
+  post_count INTEGER NOT NULL DEFAULT 0,
+  last_post TIMESTAMP,
+  FOREIGN KEY (user_id) REFERENCES user (id)
+);
+
+CREATE TRIGGER user_stats_insert AFTER INSERT ON post BEGIN
+  INSERT INTO user_stats (user_id, post_count, last_post)
+    VALUES (new.author_id, 1, new.created)
+    ON CONFLICT (user_id) DO UPDATE SET
+      post_count = post_count + 1,
+      last_post = max(coalesce(last_post, excluded.last_post),
+                      excluded.last_post);
+END;
+
+CREATE TRIGGER user_stats_delete AFTER DELETE ON post BEGIN
+  UPDATE user_stats SET
+    post_count = post_count - 1,
+    last_post = (SELECT max(created) FROM post WHERE author_id = old.author_id)
+    WHERE user_id = old.author_id;
+END;
+
+-- full-text index over post_full, so archived posts stay searchable,
+-- kept in step by the triggers below; a post is removed from the index
+-- with the body it was indexed with, before its archived body is dropped
+CREATE VIRTUAL TABLE post_fts USING fts5(
+  title, body, content='post_full', content_rowid='id'
+);
+
+-- an archived post is only inserted by reshard, after its archived body
+CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN
+  INSERT INTO post_fts (rowid, title, body)
+    VALUES (new.id, new.title, iif(new.archived,
+      (SELECT inflate(body) FROM post_archive WHERE id = new.id), new.body
+    ));
+END;
+
+CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN
+  INSERT INTO post_fts (post_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, iif(old.archived,
+      (SELECT inflate(body) FROM post_archive WHERE id = old.id), old.body
+    ));
+  DELETE FROM post_archive WHERE id = old.id;
+END;
+
+-- archiving a post leaves the index alone; editing an archived post
+-- clears archived, which drops its archived body
+CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body, archived ON post
+  WHEN old.archived OR NOT new.archived BEGIN
+  INSERT INTO post_fts (post_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, iif(old.archived,
+      (SELECT inflate(body) FROM post_archive WHERE id = old.id), old.body
+    ));
+  DELETE FROM post_archive WHERE id = new.id AND NOT new.archived;
+  INSERT INTO post_fts (rowid, title, body)
+    VALUES (new.id, new.title, iif(new.archived,
+      (SELECT inflate(body) FROM post_archive WHERE id = new.id), new.body
+    ));
+END;
+
+-- where posts live when they are sharded (see flaskr.shards): each author's
+-- shard, and the author of every post, whose AUTOINCREMENT hands out the
+-- post ids so they stay unique across shards
+CREATE TABLE shard_map (
+  author_id INTEGER PRIMARY KEY,
+  shard INTEGER NOT NULL,
+  FOREIGN KEY (author_id) REFERENCES user (id)
+);
+
+CREATE TABLE post_route (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL
+);
+
+-- who follows whom, with each author's follower count kept in step by
+-- the triggers below; pull is set for good once an author's posts stop
+-- being copied into feeds (see flaskr.feed)
+CREATE TABLE follow (
+  follower_id INTEGER NOT NULL,
+  author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (follower_id, author_id),
+  FOREIGN KEY (follower_id) REFERENCES user (id),
+  FOREIGN KEY (author_id) REFERENCES user (id)
+) WITHOUT ROWID;
+
+CREATE INDEX follow_author_idx ON follow (author_id, follower_id);
+
+CREATE TABLE follow_count (
+  author_id INTEGER PRIMARY KEY,
+  followers INTEGER NOT NULL DEFAULT 0,
+  pull INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (author_id) REFERENCES user (id)
+);
+
+CREATE TRIGGER follow_count_insert AFTER INSERT ON follow BEGIN
+  INSERT INTO follow_count (author_id, followers) VALUES (new.author_id, 1)
+    ON CONFLICT (author_id) DO UPDATE SET followers = followers + 1;
+END;
+
+CREATE TRIGGER follow_count_delete AFTER DELETE ON follow BEGIN
+  UPDATE follow_count SET followers = followers - 1
+    WHERE author_id = old.author_id;
+END;
+
+-- every user's feed: a row per post of the authors they follow, copied
+-- in when the post is written, newest last in the primary key
+CREATE TABLE feed_entry (
+  user_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL,
+  post_id INTEGER NOT NULL,
+  author_id INTEGER NOT NULL,
+  PRIMARY KEY (user_id, created, post_id),
+  FOREIGN KEY (user_id) REFERENCES user (id)
+) WITHOUT ROWID;
+
+CREATE INDEX feed_entry_post_idx ON feed_entry (post_id);
+
+-- background work queued by the views and run by `flask worker` (see
+-- flaskr.jobs); run_at and claimed_at are Unix times, and a job is
+-- deleted once it has run
+CREATE TABLE job (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  args TEXT NOT NULL,
+  state TEXT NOT NULL DEFAULT 'queued',
+  run_at REAL NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  claimed_at REAL,
+  error TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX job_state_idx ON job (state, run_at, id);
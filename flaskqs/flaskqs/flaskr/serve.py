@@ -0,0 +1,293 @@
+"""A preforking multi-process server for running flaskr in production.
+
+The master process builds the app, compiles every template, opens the
+listening socket and only then forks the workers, so they start warm and
+share all of that memory copy-on-write. Each worker serves requests on a
+fixed number of threads and only accepts a connection while one of them
+is free, leaving the rest in the socket's backlog for the other workers.
+The master keeps the worker count up, replaces workers that exit after
+``max_requests`` requests and, on SIGHUP, builds a fresh app (re-reading
+the instance config and templates) and swaps in new workers before
+stopping the old ones gracefully. SIGTERM or SIGINT stops everything
+gracefully.
+
+Workers don't share caches or metrics; each has its own, kept coherent
+with the database through PRAGMA data_version (see flaskr.cache).
+"""
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from flaskr.startup import prewarm_templates
+
+# per-process state that must not cross a fork: connections, threads and
+# process pools are rebuilt lazily in each worker
+FORK_UNSAFE = (
+    'flaskr_read_pool', 'flaskr_write_pool', 'flaskr_shard_pools',
+    'flaskr_writer', 'flaskr_shard_writers', 'flaskr_hashing',
+    'flaskr_rate_limiter', 'flaskr_version_watch',
+)
+
+
+class RequestHandler(WSGIRequestHandler):
+    # one request per connection, so an idle client never holds a thread
+    protocol_version = 'HTTP/1.0'
+
+    def log_request(self, *args, **kwargs):
+        if not self.server.quiet:
+            super().log_request(*args, **kwargs)
+
+
+class WorkerServer(BaseWSGIServer):
+    """Serves one worker's requests on ``threads`` threads, accepting from
+    the listening socket the master opened, and stops accepting once
+    ``max_requests`` requests have been handled.
+
+    A connection is only accepted once a thread is free to handle it: one
+    accepted by a busy worker would wait for that worker's threads while
+    another worker sat idle.
+    """
+
+    multithread = True
+
+    def __init__(self, app, sock, threads, max_requests, quiet):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, RequestHandler, fd=sock.fileno())
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='request')
+        # a thread free to handle the next connection, see get_request()
+        self.free = threading.Semaphore(threads)
+        self.max_requests = max_requests
+        self.quiet = quiet
+        self.handled = 0
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def get_request(self):
+        # socketserver skips the connection for now on an OSError, so the
+        # serving loop goes on checking for shutdown while all threads
+        # are busy
+        if not self.free.acquire(timeout=0.5):
+            raise OSError('No free thread.')
+
+        try:
+            return super().get_request()
+        except BaseException:
+            self.free.release()
+            raise
+
+    def shutdown_request(self, request):
+        # every accepted connection ends here, handled or not
+        try:
+            super().shutdown_request(request)
+        finally:
+            self.free.release()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+        with self._lock:
+            self.handled += 1
+            if self.max_requests and self.handled >= self.max_requests:
+                self.stop()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def stop(self):
+        # shutdown() waits for serve_forever(), so it can't run on its thread
+        if not self._stopping:
+            self._stopping = True
+            threading.Thread(target=self.shutdown).start()
+
+    def run(self):
+        self.serve_forever()
+        # finish the requests already accepted before exiting
+        self.pool.shutdown(wait=True)
+
+
+class Master:
+    def __init__(self, app, factory, host, port, workers, threads,
+                 max_requests, max_requests_jitter, graceful_timeout,
+                 quiet=False):
+        self.app = app
+        self.factory = factory
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.quiet = quiet
+        self.sock = socket.create_server((host, port), backlog=2048)
+        self.children = {}
+        self.signals = []
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def log(self, message):
+        if not self.quiet:
+            click.echo(f'[{os.getpid()}] {message}', err=True)
+
+    def prepare(self, app):
+        # load every template now, so workers inherit them compiled
+        for name, e in prewarm_templates(app):
+            self.log(f'Could not compile template {name}: {e}')
+        for key in FORK_UNSAFE:
+            app.extensions.pop(key, None)
+        # keep the garbage collector off the inherited objects, which
+        # would otherwise copy every page it touches
+        gc.collect()
+        gc.freeze()
+
+    def spawn(self, generation):
+        pid = os.fork()
+
+        if pid:
+            self.children[pid] = generation
+            return
+
+        status = 0
+        try:
+            # reloading is the master's business
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            max_requests = self.max_requests
+            if max_requests and self.max_requests_jitter:
+                max_requests += random.randint(0, self.max_requests_jitter)
+            server = WorkerServer(
+                self.app, self.sock, self.threads, max_requests, self.quiet
+            )
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *args: server.stop())
+            server.run()
+        except BaseException:
+            status = 1
+            sys.excepthook(*sys.exc_info())
+        finally:
+            # skip the master's atexit handlers and buffered output
+            os._exit(status)
+
+    def run(self):
+        def handle(signum, frame):
+            self.signals.append(signum)
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, handle)
+
+        generation = 0
+        self.prepare(self.app)
+        self.log(f'Listening on {self.sock.getsockname()[0]}:{self.port}'
+                 f' with {self.workers} workers x {self.threads} threads')
+        for _ in range(self.workers):
+            self.spawn(generation)
+
+        try:
+            while True:
+                while self.signals:
+                    signum = self.signals.pop(0)
+                    if signum == signal.SIGHUP:
+                        generation += 1
+                        self.reload(generation)
+                    else:
+                        return
+                self.reap()
+                # replace workers that exited, e.g. after max_requests
+                current = sum(1 for g in self.children.values()
+                              if g == generation)
+                for _ in range(self.workers - current):
+                    self.spawn(generation)
+                time.sleep(0.1)
+        finally:
+            self.stop(list(self.children))
+            self.sock.close()
+
+    def reload(self, generation):
+        self.log('Reloading')
+        old = list(self.children)
+        try:
+            app = self.factory()
+        except Exception as e:
+            self.log(f'Reload failed, keeping the running workers: {e}')
+            return
+        gc.unfreeze()
+        self.app = app
+        self.prepare(app)
+        for _ in range(self.workers):
+            self.spawn(generation)
+        self.stop(old)
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if self.children.pop(pid, None) is not None and status:
+                self.log(f'Worker {pid} exited with status {status}')
+
+    def stop(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while any(pid in self.children for pid in pids):
+            if time.monotonic() > deadline:
+                for pid in pids:
+                    if pid in self.children:
+                        os.kill(pid, signal.SIGKILL)
+                deadline = float('inf')
+            self.reap()
+            time.sleep(0.05)
+
+
+@click.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=8000, show_default=True)
+@click.option('--workers', type=int, default=None,
+              help='Worker processes (default: one per CPU).')
+@click.option('--threads', type=int, default=4, show_default=True,
+              help='Request threads per worker.')
+@click.option('--max-requests', type=int, default=0, show_default=True,
+              help='Replace a worker after this many requests (0: never).')
+@click.option('--max-requests-jitter', type=int, default=0,
+              show_default=True,
+              help='Add up to this many to each max-requests, so workers'
+                   ' don\'t all restart at once.')
+@click.option('--graceful-timeout', type=float, default=30.0,
+              show_default=True,
+              help='Seconds a stopping worker gets to finish its requests.')
+@click.option('--quiet', is_flag=True, help="Don't log requests.")
+def serve_command(host, port, workers, threads, max_requests,
+                  max_requests_jitter, graceful_timeout, quiet):
+    """Serve the app from preforked worker processes."""
+    from flaskr import create_app
+
+    Master(
+        current_app._get_current_object(), create_app, host, port,
+        workers or os.cpu_count() or 1, threads, max_requests,
+        max_requests_jitter, graceful_timeout, quiet,
+    ).run()
+
+
+def init_app(app):
+    app.cli.add_command(serve_command)
@@ -0,0 +1,285 @@
+"""Posts split by author over several SQLite files.
+
+With SHARDS set, the primary database (DATABASE) keeps the users and two
+routing tables: shard_map, each author's shard, and post_route, the
+author of every post, which also hands out post ids so they stay unique
+across shards. Every post, with its archived body, search index entry
+and its author's stats, lives in the SHARD_DATABASE file of its author's
+shard. A shard has the primary's schema minus the primary's own tables,
+and shard connections attach the primary as ``primary_db``, so the
+blog's SQL runs unchanged on either.
+
+A post is written to one shard; only creating or deleting it also
+touches the primary (post_route). Listings across authors read every
+shard and merge the rows, see flaskr.blog.read_posts.
+
+``flask reshard`` moves the posts to another layout. Stop the writers
+while it runs, then set SHARDS to match and restart the app (SIGHUP
+reloads ``flask serve``).
+"""
+import heapq
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+
+from flaskr.archive import register_functions
+from flaskr.cache import cached_row, get_row_cache
+from flaskr.db import get_read_db, get_write_db, init_shard, shard_database
+from flaskr.writer import execute_write
+
+
+def author_shard(username):
+    """Return the shard holding the posts of the user ``username``, or None
+    when posts aren't sharded or the user hasn't posted yet.
+    """
+    if not current_app.config['SHARDS']:
+        return None
+
+    row = get_read_db().execute(
+        'SELECT m.shard FROM user u JOIN shard_map m ON m.author_id = u.id'
+        ' WHERE u.username = ?',
+        (username,)
+    ).fetchone()
+    return None if row is None else row['shard']
+
+
+def assign_shard(author_id):
+    # new authors are spread over the shards by id
+    query = 'SELECT shard FROM shard_map WHERE author_id = ?'
+    row = get_write_db().execute(query, (author_id,)).fetchone()
+
+    if row is None:
+        execute_write(
+            'INSERT OR IGNORE INTO shard_map (author_id, shard) VALUES (?, ?)',
+            (author_id, author_id % current_app.config['SHARDS'])
+        )
+        row = get_write_db().execute(query, (author_id,)).fetchone()
+
+    return row['shard']
+
+
+def route_post(author_id):
+    """Return the (id, shard) a new post by ``author_id`` is written with,
+    or (None, None) when posts aren't sharded and the insert picks the id.
+    """
+    if not current_app.config['SHARDS']:
+        return None, None
+
+    shard = assign_shard(author_id)
+    id = execute_write(
+        'INSERT INTO post_route (author_id) VALUES (?)', (author_id,)
+    ).lastrowid
+    return id, shard
+
+
+def post_shard(id):
+    """Return the shard holding post ``id``, or None when posts aren't
+    sharded or there's no such post.
+    """
+    if not current_app.config['SHARDS']:
+        return None
+
+    row = cached_row(
+        ('route', id),
+        'SELECT m.shard FROM post_route r'
+        ' JOIN shard_map m ON m.author_id = r.author_id WHERE r.id = ?',
+        (id,)
+    )
+    return None if row is None else row['shard']
+
+
+def unroute_post(id):
+    # after the post itself is gone, so it never outlives its route
+    if not current_app.config['SHARDS']:
+        return
+
+    execute_write('DELETE FROM post_route WHERE id = ?', (id,))
+    get_row_cache().discard(('route', id))
+
+
+def sync_sequences(db):
+    """Keep the AUTOINCREMENT sequences of post (where bulk loads land
+    before they're sharded) and post_route (which numbers new posts)
+    past every id either has handed out.
+    """
+    seq = db.execute(
+        "SELECT max(seq) FROM sqlite_sequence"
+        " WHERE name IN ('post', 'post_route')"
+    ).fetchone()[0]
+
+    if seq is None:
+        return
+
+    for name in ('post', 'post_route'):
+        cursor = db.execute(
+            'UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (seq, name)
+        )
+        if not cursor.rowcount:
+            db.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                (name, seq)
+            )
+
+
+@contextmanager
+def attached(db, shard, name):
+    """Attach ``shard`` to ``db`` as ``name`` and yield the name to use in
+    SQL, or yield 'main' for None, the primary database.
+    """
+    if shard is None:
+        yield 'main'
+        return
+
+    db.execute('ATTACH DATABASE ? AS ' + name, (shard_database(shard),))
+    try:
+        yield name
+    finally:
+        db.execute('DETACH DATABASE ' + name)
+
+
+def spread(counts, shards, assignment=()):
+    """Assign authors to shards from their post counts, largest first, each
+    to the shard with the fewest posts so far, on top of an existing
+    ``assignment`` of {author_id: shard}.
+    """
+    assignment = dict(assignment)
+    loads = [0] * shards
+    for author_id, shard in assignment.items():
+        loads[shard] += counts.get(author_id, 0)
+    loads = [(load, shard) for shard, load in enumerate(loads)]
+    heapq.heapify(loads)
+
+    for author_id, posts in sorted(counts.items(),
+                                   key=lambda item: (-item[1], item[0])):
+        if author_id in assignment:
+            continue
+        load, shard = heapq.heappop(loads)
+        assignment[author_id] = shard
+        heapq.heappush(loads, (load + posts, shard))
+
+    return assignment
+
+
+def reshard(count, rebalance=True):
+    """Move every post to its author's shard in a layout of ``count``
+    shards (0: back into the primary database) and return how many posts
+    moved. Without ``rebalance``, authors who already have one of those
+    shards keep it and only the others are spread.
+
+    Posts move between two files at a time, each batch in a transaction
+    of its own; a batch that was interrupted is simply moved again, so an
+    interrupted reshard can be run again.
+    """
+    with current_app.open_resource('schema.sql') as f:
+        schema = f.read().decode('utf8')
+
+    existing = 0
+    while os.path.exists(shard_database(existing)):
+        existing += 1
+    for shard in range(existing, count):
+        init_shard(shard_database(shard), schema)
+
+    sources = [None, *range(max(existing, count))]
+    targets = list(range(count)) or [None]
+    db = sqlite3.connect(current_app.config['DATABASE'], isolation_level=None)
+    # the search triggers read archived bodies
+    register_functions(db)
+    moved = 0
+
+    try:
+        counts = {}
+        for source in sources:
+            with attached(db, source, 'source') as src:
+                for author_id, posts in db.execute(
+                    f'SELECT author_id, COUNT(*) FROM {src}.post'
+                    ' GROUP BY author_id'
+                ):
+                    counts[author_id] = counts.get(author_id, 0) + posts
+
+        if count:
+            kept = ()
+            if not rebalance:
+                kept = db.execute(
+                    'SELECT author_id, shard FROM shard_map WHERE shard < ?',
+                    (count,)
+                ).fetchall()
+            assignment = spread(counts, count, kept)
+        else:
+            assignment = dict.fromkeys(counts)
+
+        db.execute(
+            'CREATE TEMP TABLE moves (author_id INTEGER PRIMARY KEY, shard)'
+        )
+        db.executemany('INSERT INTO temp.moves VALUES (?, ?)',
+                       assignment.items())
+        authors = 'SELECT author_id FROM temp.moves WHERE shard IS ?'
+
+        for source in sources:
+            for target in targets:
+                if target == source:
+                    continue
+                with attached(db, source, 'source') as src, \
+                        attached(db, target, 'target') as dst:
+                    db.execute('BEGIN')
+                    # archived bodies first, for the search index to find
+                    # as their posts are inserted
+                    db.execute(
+                        f'INSERT OR REPLACE INTO {dst}.post_archive'
+                        f' SELECT * FROM {src}.post_archive'
+                        f' WHERE id IN (SELECT id FROM {src}.post'
+                        f' WHERE author_id IN ({authors}))',
+                        (target,)
+                    )
+                    cursor = db.execute(
+                        f'INSERT OR REPLACE INTO {dst}.post'
+                        f' SELECT * FROM {src}.post'
+                        f' WHERE author_id IN ({authors})',
+                        (target,)
+                    )
+                    db.execute(
+                        f'DELETE FROM {src}.post'
+                        f' WHERE author_id IN ({authors})',
+                        (target,)
+                    )
+                    db.execute('COMMIT')
+                    moved += cursor.rowcount
+
+        db.execute('DELETE FROM shard_map')
+        db.execute('DELETE FROM post_route')
+        if count:
+            db.execute('INSERT INTO shard_map SELECT * FROM temp.moves')
+            for target in targets:
+                with attached(db, target, 'target') as dst:
+                    db.execute(
+                        'INSERT INTO post_route (id, author_id)'
+                        f' SELECT id, author_id FROM {dst}.post'
+                    )
+        sync_sequences(db)
+    finally:
+        db.close()
+
+    get_row_cache().clear()
+    return moved
+
+
+@click.command('reshard')
+@click.option('--shards', type=int, required=True,
+              help='Shards to spread the posts over (0: none, keep them'
+                   ' in the primary database).')
+def reshard_command(shards):
+    """Move the posts of every author to their shard in a new layout."""
+    start = time.perf_counter()
+    moved = reshard(shards)
+    click.echo(f'Moved {moved} posts in {time.perf_counter() - start:.2f}s.')
+
+    if shards != current_app.config['SHARDS']:
+        click.echo(f'Set SHARDS = {shards} in the instance config and'
+                   ' restart the app.')
+
+
+def init_app(app):
+    app.cli.add_command(reshard_command)
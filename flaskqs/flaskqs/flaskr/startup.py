@@ -0,0 +1,141 @@
+"""Worker start-up: the compiled-template cache, template pre-warming and
+``flask startup-profile``.
+
+Templates are compiled to Python bytecode the first time they render.
+With TEMPLATE_BYTECODE_CACHE the bytecode is kept in
+``instance/jinja-cache``, so only the first process ever to render a
+template compiles it and later ones just load it. PREWARM_TEMPLATES
+goes further and loads every template in create_app, before the first
+request arrives.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import click
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+# run in a fresh interpreter by startup-profile, so imports are cold
+PROFILE_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import flaskr
+imported = time.perf_counter() - start
+from flaskr.startup import profile
+json.dump(profile(imported, sys.argv[1:]), sys.stdout)
+'''
+
+
+class Stopwatch:
+    """Times the phases of create_app, each from the end of the last."""
+
+    def __init__(self):
+        self.phases = []
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+
+def get_cache_folder(app):
+    return os.path.join(app.instance_path, 'jinja-cache')
+
+
+def prewarm_templates(app):
+    """Load every template, compiling the ones not in the bytecode cache,
+    and return the (name, error) of those that failed.
+    """
+    errors = []
+
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            errors.append((name, e))
+
+    return errors
+
+
+def profile(imported, paths):
+    """Build the app and request each of ``paths`` twice, returning how
+    long every step took in seconds.
+    """
+    from flaskr import create_app
+
+    start = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter() - start
+    client = app.test_client()
+    responses = []
+
+    for path in paths:
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            status = client.get(path).status_code
+            timings.append(time.perf_counter() - start)
+        responses.append((path, status, *timings))
+
+    return {
+        'import': imported,
+        'create_app': created,
+        'phases': app.extensions['flaskr_startup'],
+        'responses': responses,
+    }
+
+
+@click.command('startup-profile')
+@click.option('--path', 'paths', multiple=True,
+              default=('/auth/login', '/'), show_default=True,
+              help='Request this path after start-up (repeatable).')
+@click.option('--clear-cache', is_flag=True,
+              help='Empty the template bytecode cache first.')
+def startup_profile_command(paths, clear_cache):
+    """Time a cold start: imports, create_app phases, first responses."""
+    if clear_cache:
+        shutil.rmtree(get_cache_folder(current_app), ignore_errors=True)
+
+    result = subprocess.run(
+        [sys.executable, '-c', PROFILE_SCRIPT, *paths],
+        capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise click.ClickException(result.stderr.strip())
+    result = json.loads(result.stdout)
+
+    def line(label, seconds):
+        click.echo(f'{label:<32} {seconds * 1000:8.1f} ms')
+
+    line('import flaskr', result['import'])
+    line('create_app', result['create_app'])
+    for name, seconds in result['phases']:
+        line(f'  {name}', seconds)
+    for path, status, first, second in result['responses']:
+        line(f'first GET {path} ({status})', first)
+        line(f'  then', second)
+    ready = result['import'] + result['create_app']
+    if result['responses']:
+        ready += result['responses'][0][2]
+    line('ready (import to first response)', ready)
+
+
+def init_app(app, stopwatch):
+    app.cli.add_command(startup_profile_command)
+
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        folder = get_cache_folder(app)
+        os.makedirs(folder, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder)
+
+    if app.config['PREWARM_TEMPLATES']:
+        for name, e in prewarm_templates(app):
+            app.logger.warning('Could not compile template %s: %s', name, e)
+        stopwatch.lap('templates')
+
+    app.extensions['flaskr_startup'] = stopwatch.phases
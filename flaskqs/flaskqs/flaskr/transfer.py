@@ -0,0 +1,291 @@
+import csv
+import heapq
+import itertools
+import json
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+from flaskr.db import (
+    get_read_db, get_write_db, post_shards, rebuild_user_stats,
+    reindex_search
+)
+from flaskr.render import rerender_posts
+from flaskr.shards import reshard, sync_sequences
+
+POST_FIELDS = ('id', 'username', 'created', 'title', 'body')
+USER_FIELDS = ('id', 'username', 'password')
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod'
+    ' tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam'
+    ' quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo'
+).split()
+
+
+def write_rows(rows, fields, output, fmt):
+    count = 0
+
+    if fmt == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            output.write(json.dumps(dict(zip(fields, row)), default=str))
+            output.write('\n')
+            count += 1
+
+    return count
+
+
+def read_rows(input, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(input)
+    else:
+        for line in input:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+@contextmanager
+def deferred_maintenance(db, table):
+    """Drop the secondary indexes and triggers on ``table`` for the duration
+    of a bulk load and recreate them from their saved SQL afterwards.
+
+    Writes made by other connections in the meantime skip the triggers too,
+    so whatever the triggers maintain must be rebuilt once this exits.
+    """
+    saved = db.execute(
+        "SELECT type, name, sql FROM sqlite_master"
+        " WHERE tbl_name = ? AND type IN ('index', 'trigger')"
+        " AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+
+    for type, name, _ in saved:
+        db.execute(f'DROP {type.upper()} IF EXISTS "{name}"')
+    db.commit()
+
+    try:
+        yield
+    finally:
+        db.rollback()
+        for _, _, sql in saved:
+            db.execute(sql)
+        db.commit()
+
+
+def load_posts(rows, batch_size=5000):
+    """Insert (author_id, created, title, body) tuples in batched
+    transactions, with index, search and stats maintenance and Markdown
+    rendering deferred to the end.
+    A created of None means now.
+
+    When posts are sharded they are loaded into the primary database and
+    then moved to their shards.
+
+    If the load fails partway, the batches already committed stay, and
+    are indexed, counted and rendered before the error propagates.
+    """
+    db = get_write_db()
+    shards = current_app.config['SHARDS']
+    count = 0
+
+    if shards:
+        # the loaded posts must not take ids post_route has handed out
+        sync_sequences(db)
+        db.commit()
+
+    try:
+        with deferred_maintenance(db, 'post'):
+            for batch in batched(rows, batch_size):
+                db.executemany(
+                    'INSERT INTO post (author_id, created, title, body)'
+                    ' VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)',
+                    batch
+                )
+                db.commit()
+                count += len(batch)
+    finally:
+        reindex_search()
+        rebuild_user_stats()
+        rerender_posts(current_app.config['RENDER_WORKERS'])
+        if shards:
+            reshard(shards, rebalance=False)
+
+    return count
+
+
+def import_posts(rows, batch_size=5000):
+    """Insert exported posts, resolving authors by username.
+
+    Returns the number of rows imported and the number skipped because
+    their author doesn't exist.
+    """
+    authors = dict(get_write_db().execute('SELECT username, id FROM user'))
+    skipped = 0
+
+    def resolve():
+        nonlocal skipped
+        for row in rows:
+            author_id = authors.get(row['username'])
+            if author_id is None:
+                skipped += 1
+                continue
+            yield (author_id, row.get('created') or None,
+                   row['title'], row['body'])
+
+    return load_posts(resolve(), batch_size), skipped
+
+
+def import_users(rows, batch_size=5000):
+    db = get_write_db()
+    imported = 0
+
+    for batch in batched(rows, batch_size):
+        cursor = db.executemany(
+            'INSERT OR IGNORE INTO user (username, password) VALUES (?, ?)',
+            [(row['username'], row['password']) for row in batch]
+        )
+        db.commit()
+        imported += cursor.rowcount
+
+    return imported
+
+
+def seed(users, posts, password='password', days=365, batch_size=5000,
+         rng=None):
+    """Add users named user<id>, all with the same password, and posts by
+    random authors spread over the last ``days`` days.
+    """
+    rng = rng or random.Random(0)
+    db = get_write_db()
+    pwhash = generate_password_hash(
+        password, current_app.config['PASSWORD_HASH_METHOD']
+    )
+    first = (db.execute('SELECT MAX(id) FROM user').fetchone()[0] or 0) + 1
+    import_users(
+        ({'username': f'user{n}', 'password': pwhash}
+         for n in range(first, first + users)),
+        batch_size
+    )
+
+    authors = [row[0] for row in db.execute('SELECT id FROM user')]
+    if not authors:
+        return 0
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    seconds = days * 24 * 60 * 60
+
+    def generate():
+        for n in range(posts):
+            created = now - timedelta(seconds=rng.randrange(seconds))
+            yield (
+                rng.choice(authors),
+                created.isoformat(' '),
+                ' '.join(rng.choices(WORDS, k=rng.randint(2, 8))).capitalize(),
+                ' '.join(rng.choices(WORDS, k=rng.randint(20, 200))),
+            )
+
+    return load_posts(generate(), batch_size)
+
+
+def report(verb, count, start):
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    click.echo(f'{verb} {count} rows in {elapsed:.2f}s ({rate:.0f} rows/s).',
+               err=True)
+
+
+format_option = click.option(
+    '--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default='jsonl',
+    show_default=True
+)
+batch_option = click.option(
+    '--batch-size', type=int, default=5000, show_default=True,
+    help='Rows per transaction.'
+)
+
+
+@click.command('export-posts')
+@format_option
+@click.option('--output', type=click.File('w'), default='-')
+def export_posts_command(fmt, output):
+    """Stream every post, with its author's username, as JSONL or CSV."""
+    start = time.perf_counter()
+    rows = heapq.merge(*(get_read_db(shard).execute(
+        'SELECT p.id, username, created, title, body'
+        ' FROM post_full p JOIN user u ON p.author_id = u.id'
+        ' ORDER BY p.id'
+    ) for shard in post_shards()), key=lambda row: row[0])
+    report('Exported', write_rows(rows, POST_FIELDS, output, fmt), start)
+
+
+@click.command('import-posts')
+@format_option
+@batch_option
+@click.argument('input', type=click.File('r'), default='-')
+def import_posts_command(fmt, batch_size, input):
+    """Bulk-load posts written by export-posts."""
+    start = time.perf_counter()
+    imported, skipped = import_posts(read_rows(input, fmt), batch_size)
+    report('Imported', imported, start)
+    if skipped:
+        click.echo(f'Skipped {skipped} posts by unknown authors.', err=True)
+
+
+@click.command('export-users')
+@format_option
+@click.option('--output', type=click.File('w'), default='-')
+def export_users_command(fmt, output):
+    """Stream every user, with their password hash, as JSONL or CSV."""
+    start = time.perf_counter()
+    rows = get_read_db().execute(
+        'SELECT id, username, password FROM user ORDER BY id'
+    )
+    report('Exported', write_rows(rows, USER_FIELDS, output, fmt), start)
+
+
+@click.command('import-users')
+@format_option
+@batch_option
+@click.argument('input', type=click.File('r'), default='-')
+def import_users_command(fmt, batch_size, input):
+    """Bulk-load users written by export-users, skipping taken usernames."""
+    start = time.perf_counter()
+    report('Imported', import_users(read_rows(input, fmt), batch_size), start)
+
+
+@click.command('seed')
+@click.option('--users', type=int, default=100, show_default=True)
+@click.option('--posts', type=int, default=10000, show_default=True)
+@click.option('--password', default='password', show_default=True,
+              help='Password given to every seeded user.')
+@click.option('--days', type=int, default=365, show_default=True,
+              help='Spread post timestamps over this many days.')
+@batch_option
+def seed_command(users, posts, password, days, batch_size):
+    """Fill the database with synthetic users and posts."""
+    start = time.perf_counter()
+    report('Seeded', seed(users, posts, password, days, batch_size), start)
+
+
+def init_app(app):
+    app.cli.add_command(export_posts_command)
+    app.cli.add_command(import_posts_command)
+    app.cli.add_command(export_users_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(seed_command)
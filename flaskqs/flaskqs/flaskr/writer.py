@@ -0,0 +1,203 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+from flaskr.db import PoolTimeout, get_write_db, get_pool
+
+WriteResult = namedtuple('WriteResult', 'lastrowid rowcount')
+
+
+class WriterStopped(ServiceUnavailable):
+    description = 'The database writer stopped before applying the write.'
+
+
+class GroupCommitWriter:
+    """A single thread that applies queued writes on its own connection,
+    committing everything that arrived within ``window`` seconds of the
+    first write as one transaction.
+
+    Each write runs in its own savepoint, so one failing statement only
+    fails its own caller. The connection commits with synchronous=FULL:
+    the fsync is shared by the whole group, and callers are released only
+    once their write is durable.
+
+    A caller waits at most ``timeout`` seconds and then gets a PoolTimeout;
+    its write is dropped unless the thread has already taken it up. If the
+    thread stops, the writes still queued fail with WriterStopped, and the
+    next write starts a new thread.
+    """
+
+    def __init__(self, pool, window=0.002, max_batch=256, timeout=5.0):
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def execute(self, sql, parameters=()):
+        """Queue one write and wait until it has been committed."""
+        future = Future()
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='flaskr-writer', daemon=True
+                )
+                self._thread.start()
+            self._queue.put((sql, parameters, future))
+
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PoolTimeout() from None
+
+    def close(self):
+        with self._lock:
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        conn = None
+        batch = []
+        running = True
+
+        try:
+            conn = self.pool.connect()
+            conn.execute('PRAGMA synchronous = FULL')
+
+            while running:
+                item = self._queue.get()
+                if item is None:
+                    break
+
+                batch = [item]
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get(
+                            timeout=max(deadline - time.monotonic(), 0)
+                        )
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+
+                self._apply(conn, batch)
+                batch = []
+        finally:
+            if conn is not None:
+                conn.close()
+
+            # whatever is queued now would never be applied
+            with self._lock:
+                self._thread = None
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        batch.append(item)
+
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(WriterStopped())
+
+    def _apply(self, conn, batch):
+        done = []
+
+        try:
+            # deferred, not IMMEDIATE: a shard's connection has the primary
+            # attached, and BEGIN IMMEDIATE would lock that too, so the
+            # shards' writers would all wait on each other. Each write takes
+            # the lock of the database it writes to as it starts.
+            conn.execute('BEGIN')
+            for sql, parameters, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    # its caller timed out
+                    continue
+                conn.execute('SAVEPOINT write')
+                try:
+                    cursor = conn.execute(sql, parameters)
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO write')
+                    future.set_exception(e)
+                else:
+                    done.append(
+                        (future, WriteResult(cursor.lastrowid, cursor.rowcount))
+                    )
+                conn.execute('RELEASE write')
+            conn.commit()
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for future, _ in done:
+                future.set_exception(e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result in done:
+            future.set_result(result)
+
+
+def get_writer(shard=None):
+    """Return the group-commit writer of the primary database or of a
+    shard, each of which has its own.
+    """
+    if shard is None:
+        extensions = current_app.extensions
+        key = 'flaskr_writer'
+    else:
+        extensions = current_app.extensions.setdefault(
+            'flaskr_shard_writers', {}
+        )
+        key = shard
+    writer = extensions.get(key)
+
+    if writer is None:
+        config = current_app.config
+        writer = extensions.setdefault(
+            key,
+            GroupCommitWriter(
+                get_pool('write', shard),
+                config['GROUP_COMMIT_WINDOW_MS'] / 1000,
+                config['GROUP_COMMIT_MAX_BATCH'],
+                config['DB_POOL_TIMEOUT'],
+            )
+        )
+
+    return writer
+
+
+def execute_write(sql, parameters=(), shard=None):
+    """Run a single write statement and commit it, through the group-commit
+    writer when GROUP_COMMIT is on, on the primary database or a shard.
+    """
+    if current_app.config['GROUP_COMMIT']:
+        return get_writer(shard).execute(sql, parameters)
+
+    db = get_write_db(shard)
+    cursor = db.execute(sql, parameters)
+    db.commit()
+    return WriteResult(cursor.lastrowid, cursor.rowcount)
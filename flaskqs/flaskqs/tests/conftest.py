@@ -0,0 +1,84 @@
+import os
+
+import pytest
+from jinja2 import FunctionLoader
+
+from flaskr import create_app
+from flaskr.db import init_db
+
+PACKAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flaskr')
+
+
+def load_template(name):
+    # the templates sit beside the modules here rather than under
+    # templates/auth and templates/blog
+    path = os.path.join(PACKAGE, os.path.basename(name))
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding='utf8') as f:
+        return f.read(), path, lambda: True
+
+
+@pytest.fixture
+def config():
+    """Config on top of the test defaults; override it in a module to
+    test with other settings.
+    """
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, config):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+        'SHARD_DATABASE': str(tmp_path / 'flaskr-shard-{}.sqlite'),
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'HASH_WORKERS': 0,
+        'RENDER_WORKERS': 0,
+        'TEMPLATE_BYTECODE_CACHE': False,
+        'STATIC_BUILD_FOLDER': str(tmp_path / 'static'),
+        **config,
+    })
+    app.jinja_loader = FunctionLoader(load_template)
+
+    with app.app_context():
+        init_db()
+
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def runner(app):
+    return app.test_cli_runner()
+
+
+class AuthActions:
+    def __init__(self, client):
+        self._client = client
+
+    def register(self, username='test', password='test'):
+        return self._client.post(
+            '/auth/register',
+            data={'username': username, 'password': password}
+        )
+
+    def login(self, username='test', password='test'):
+        return self._client.post(
+            '/auth/login', data={'username': username, 'password': password}
+        )
+
+    def logout(self):
+        return self._client.get('/auth/logout')
+
+
+@pytest.fixture
+def auth(client):
+    return AuthActions(client)
@@ -0,0 +1,117 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from flaskr.archive import archive_posts
+from flaskr.db import get_write_db, reindex_search
+from flaskr.shards import reshard
+
+
+@pytest.fixture
+def archived(app):
+    with app.app_context():
+        db = get_write_db()
+        db.execute(
+            "INSERT INTO user (username, password) VALUES ('test', ?)",
+            (generate_password_hash('test', 'pbkdf2:sha256:1000'),)
+        )
+        db.executemany(
+            'INSERT INTO post (author_id, title, body, body_html)'
+            ' VALUES (1, ?, ?, ?)',
+            [('old', 'an aardvark', '<p>an aardvark</p>'),
+             ('other', 'a badger', '<p>a badger</p>')]
+        )
+        db.commit()
+        assert archive_posts(datetime.now() + timedelta(days=1)) == 2
+
+    return app
+
+
+def archived_ids(db):
+    return [row['id'] for row in db.execute('SELECT id FROM post_archive')]
+
+
+def search(client, q):
+    return client.get('/search', query_string={'q': q}).data
+
+
+def check_index(app, shards=(None,)):
+    with app.app_context():
+        for shard in shards:
+            # compares the index with post_full, archived bodies included
+            get_write_db(shard).execute(
+                "INSERT INTO post_fts (post_fts) VALUES ('integrity-check')"
+            )
+
+
+def test_search_archived(archived, client):
+    assert b'old' in search(client, 'aardvark')
+    assert b'<mark>aardvark</mark>' in search(client, 'aardvark')
+    check_index(archived)
+
+
+def test_reindex_archived(archived, client):
+    with archived.app_context():
+        reindex_search()
+
+    assert b'old' in search(client, 'aardvark')
+    check_index(archived)
+
+
+def test_edit_archived(archived, client):
+    with archived.app_context():
+        db = get_write_db()
+        db.execute("UPDATE post SET title = 'new' WHERE id = 1")
+        db.execute(
+            "UPDATE post SET body = 'a cassowary', archived = 0 WHERE id = 2"
+        )
+        db.commit()
+        assert archived_ids(db) == [1]
+
+    assert b'new' in search(client, 'aardvark')
+    assert b'other' not in search(client, 'badger')
+    assert b'other' in search(client, 'cassowary')
+    check_index(archived)
+
+
+def test_edit_archived_to_empty(archived, client):
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    client.post('/1/update', data={'title': 'old', 'body': ''})
+
+    with archived.app_context():
+        assert archived_ids(get_write_db()) == [2]
+
+    assert b'aardvark' not in client.get('/1').data
+    assert b'aardvark' not in client.get('/1/update').data
+    assert b'old' not in search(client, 'aardvark')
+    check_index(archived)
+
+
+def test_body_needs_unarchiving(archived):
+    with archived.app_context():
+        with pytest.raises(sqlite3.IntegrityError):
+            get_write_db().execute(
+                "UPDATE post SET body = 'a cassowary' WHERE id = 2"
+            )
+
+
+def test_delete_archived(archived, client):
+    with archived.app_context():
+        db = get_write_db()
+        db.execute('DELETE FROM post WHERE id = 1')
+        db.commit()
+        assert archived_ids(db) == [2]
+
+    assert b'old' not in search(client, 'aardvark')
+    check_index(archived)
+
+
+def test_reshard_archived(archived, client):
+    with archived.app_context():
+        reshard(2)
+    archived.config['SHARDS'] = 2
+
+    assert b'old' in search(client, 'aardvark')
+    check_index(archived, (0, 1))
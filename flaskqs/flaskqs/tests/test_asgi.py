@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('asgiref')
+
+from flaskr.asgi import ThreadedWsgiToAsgi  # noqa: E402
+
+
+async def get(asgi, path):
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': 'GET',
+        'path': path, 'query_string': b'',
+        'root_path': '', 'headers': [], 'server': ('127.0.0.1', 80),
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi(scope, receive, send)
+    return sent[0]['status']
+
+
+def test_requests_run_at_once(app):
+    @app.route('/sleep')
+    def sleep():
+        time.sleep(0.5)
+        return 'Slept.'
+
+    asgi = ThreadedWsgiToAsgi(app, 4)
+
+    async def main():
+        return await asyncio.gather(*(get(asgi, '/sleep') for _ in range(4)))
+
+    start = time.perf_counter()
+    assert asyncio.run(main()) == [200] * 4
+    assert time.perf_counter() - start < 1.5
@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+STYLESHEET = re.compile(r'<link rel="stylesheet" href="([^"]+)">')
+
+
+def stylesheet(client):
+    return STYLESHEET.search(client.get('/auth/login').text).group(1)
+
+
+def test_fingerprinted_url(client):
+    url = stylesheet(client)
+    assert re.fullmatch(r'/static/style\.[0-9a-f]{12}\.css', url)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/css'
+    assert response.cache_control.max_age == 365 * 24 * 60 * 60
+    assert response.cache_control.immutable
+    assert response.cache_control.public
+    assert b'body' in response.data
+
+
+def test_gzipped(client):
+    url = stylesheet(client)
+    plain = client.get(url).data
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.content_encoding == 'gzip'
+    assert len(response.data) < len(plain)
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_unbuilt_name_still_served(client):
+    response = client.get('/static/style.css')
+    assert response.status_code == 200
+    assert not response.cache_control.immutable
+
+
+@pytest.mark.parametrize('config', [{'STATIC_FINGERPRINT': False}])
+def test_disabled(client):
+    assert stylesheet(client) == '/static/style.css'
+
+
+def test_build_command(app, runner):
+    with app.app_context():
+        result = runner.invoke(args=['build-static'])
+
+    assert re.search(r'style\.css -> style\.[0-9a-f]{12}\.css', result.output)
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from flaskr.db import get_write_db
+from flaskr.hashing import HashingBusy, HashingPool
+
+
+def stored_hash(app, username='test'):
+    with app.app_context():
+        return get_write_db().execute(
+            'SELECT password FROM user WHERE username = ?', (username,)
+        ).fetchone()[0]
+
+
+def test_register_and_login(app, client, auth):
+    assert auth.register().headers['Location'] == '/auth/login'
+    assert stored_hash(app).startswith('pbkdf2:sha256:1000$')
+
+    assert auth.login().headers['Location'] == '/'
+    assert b'Log Out' in client.get('/').data
+
+
+@pytest.mark.parametrize(('username', 'password', 'message'), [
+    ('nobody', 'test', b'Incorrect username.'),
+    ('test', 'wrong', b'Incorrect password.'),
+])
+def test_login_fails(client, auth, username, password, message):
+    auth.register()
+    assert message in auth.login(username, password).data
+
+
+@pytest.fixture
+def old_hash(app):
+    with app.app_context():
+        db = get_write_db()
+        db.execute(
+            "INSERT INTO user (username, password) VALUES ('test', ?)",
+            (generate_password_hash('test', 'pbkdf2:sha256:500'),)
+        )
+        db.commit()
+
+
+def test_rehash_on_login(app, auth, old_hash):
+    auth.login()
+    upgraded = stored_hash(app)
+    assert upgraded.startswith('pbkdf2:sha256:1000$')
+    assert check_password_hash(upgraded, 'test')
+
+    auth.logout()
+    auth.login()
+    assert stored_hash(app) == upgraded
+
+
+def test_no_rehash_on_failed_login(app, auth, old_hash):
+    auth.login(password='wrong')
+    assert stored_hash(app).startswith('pbkdf2:sha256:500$')
+
+
+def test_hashing_pool_busy():
+    pool = HashingPool(workers=1, max_pending=1, retry_after=3)
+    slow = threading.Thread(target=pool.run, args=(time.sleep, 1.0))
+    slow.start()
+    time.sleep(0.1)
+
+    try:
+        with pytest.raises(HashingBusy) as e:
+            pool.run(time.sleep, 0)
+        assert e.value.retry_after == 3
+    finally:
+        slow.join()
+        pool.shutdown()
+
+    # the slot is free again
+    pool.run(time.sleep, 0)
+    pool.shutdown()
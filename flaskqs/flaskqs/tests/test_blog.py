@@ -0,0 +1,107 @@
+import pytest
+
+from flaskr.blog import get_author_page, get_page
+from flaskr.db import get_write_db
+
+
+@pytest.fixture
+def config():
+    return {'POSTS_PER_PAGE': 2}
+
+
+@pytest.fixture
+def posts(app):
+    # two authors; posts 2 and 3 share a timestamp, so the id decides
+    with app.app_context():
+        db = get_write_db()
+        db.executemany(
+            'INSERT INTO user (username, password) VALUES (?, ?)',
+            [('one', 'x'), ('two', 'x')]
+        )
+        db.executemany(
+            'INSERT INTO post (author_id, created, title, body)'
+            " VALUES (?, ?, ?, '')",
+            [(1, '2024-01-01 00:00:00', 'a'),
+             (2, '2024-01-02 00:00:00', 'b'),
+             (1, '2024-01-02 00:00:00', 'c'),
+             (2, '2024-01-03 00:00:00', 'd'),
+             (1, '2024-01-04 00:00:00', 'e')]
+        )
+        db.commit()
+
+
+def titles(page):
+    return [post['title'] for post in page]
+
+
+def walk(read):
+    """Page through ``read`` to the end and back, returning the titles of
+    every page on the way.
+    """
+    page = read()
+    down = [titles(page)]
+    assert page.prev_cursor is None
+    while page.next_cursor is not None:
+        page = read(before=page.next_cursor)
+        down.append(titles(page))
+
+    up = []
+    while page.prev_cursor is not None:
+        page = read(after=page.prev_cursor)
+        up.append(titles(page))
+
+    return down, up
+
+
+def test_index_pages(app, posts):
+    with app.test_request_context():
+        down, up = walk(get_page)
+
+    assert down == [['e', 'd'], ['c', 'b'], ['a']]
+    assert up == [['c', 'b'], ['e', 'd']]
+
+
+def test_author_pages(app, posts):
+    with app.test_request_context():
+        down, up = walk(
+            lambda before=None, after=None: get_author_page(1, before, after)
+        )
+
+    assert down == [['e', 'c'], ['a']]
+    assert up == [['e', 'c']]
+
+
+def test_past_either_end(app, posts):
+    with app.test_request_context():
+        page = get_page(before='2024-01-01 00:00:00,1')
+        assert titles(page) == []
+        assert page.next_cursor is None
+        assert page.prev_cursor is None
+
+        page = get_page(after='2024-01-04 00:00:00,5')
+        assert titles(page) == []
+        assert page.prev_cursor is None
+
+
+def test_empty(app):
+    with app.test_request_context():
+        page = get_page()
+        assert titles(page) == []
+        assert page.next_cursor is None
+        assert page.prev_cursor is None
+
+
+def test_index_links(client, posts):
+    page = client.get('/').data
+    assert b'before=2024-01-03+00:00:00,4' in page
+    assert b'after=' not in page
+
+    page = client.get('/?before=2024-01-03 00:00:00,4').data
+    assert b'>c</a>' in page and b'>b</a>' in page
+    assert b'after=2024-01-02+00:00:00,3' in page
+
+
+@pytest.mark.parametrize('cursor', ['x', '2024-01-01', '2024-01-01,x'])
+def test_invalid_cursor(client, cursor):
+    assert client.get('/', query_string={'before': cursor}).status_code == 400
+    assert client.get('/', query_string={'after': cursor}).status_code == 400
@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+
+from flaskr import cache, create_app
+from flaskr.archive import register_functions
+from flaskr.cache import RowCache, get_page_cache, get_version_watch
+from flaskr.db import get_write_db
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_row_cache_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    rows = RowCache(2, ttl=60)
+
+    rows.set('a', 1, rows.generation)
+    clock.now += 59
+    assert rows.get('a') == 1
+    clock.now += 2
+    assert rows.get('a') is None
+
+
+def test_row_cache_evicts_least_recent():
+    rows = RowCache(2, ttl=60)
+    for key in 'abc':
+        rows.set(key, key, rows.generation)
+        rows.get('a')
+
+    assert [rows.get(key) for key in 'abc'] == ['a', None, 'c']
+
+
+def test_row_read_before_write_not_stored():
+    rows = RowCache(2, ttl=60)
+    generation = rows.generation
+    # a write lands while the row is being read
+    rows.discard('a')
+    rows.set('a', 'stale', generation)
+
+    assert rows.get('a') is None
+
+
+@pytest.fixture
+def post(client, auth):
+    auth.register()
+    auth.login()
+    client.post('/create', data={'title': 'first', 'body': 'Hello.'})
+
+
+def other_process(app, sql):
+    # a connection of its own, as another worker process would have
+    db = sqlite3.connect(app.config['DATABASE'])
+    register_functions(db)
+    db.execute(sql)
+    db.commit()
+    db.close()
+
+
+def test_write_elsewhere_invalidates(app, client, post):
+    assert b'first' in client.get('/1').data
+    assert b'first' in client.get('/').data
+
+    other_process(app, "UPDATE post SET title = 'second' WHERE id = 1")
+    assert b'second' in client.get('/1').data
+    assert b'second' in client.get('/').data
+
+    other_process(app, 'DELETE FROM post WHERE id = 1')
+    assert client.get('/1').status_code == 404
+    assert b'second' not in client.get('/').data
+
+
+def test_write_here_invalidates(app, client, post):
+    assert b'first' in client.get('/1').data
+
+    client.post('/1/update', data={'title': 'second', 'body': 'Hi.'})
+    assert b'second' in client.get('/1').data
+    assert b'second' in client.get('/').data
+
+    client.post('/1/delete')
+    assert client.get('/1').status_code == 404
+
+
+def test_every_commit_seen_once(app):
+    with app.app_context():
+        watch = get_version_watch()
+        watch.changed()
+        assert not watch.changed()
+
+        db = get_write_db()
+        db.execute("INSERT INTO user (username, password) VALUES ('a', 'x')")
+        db.commit()
+        assert watch.changed()
+        assert not watch.changed()
+
+
+def test_etag_same_in_every_process(app, client):
+    other = create_app(app.config)
+    with other.app_context():
+        # as in a worker that has seen more writes
+        get_page_cache().bump_version()
+        get_page_cache().bump_version()
+
+    etag = client.get('/api/posts').headers['ETag']
+    response = other.test_client().get(
+        '/api/posts', headers={'If-None-Match': etag}
+    )
+
+    assert response.headers['ETag'] == etag
+    assert response.status_code == 304
@@ -0,0 +1,136 @@
+import pytest
+
+from flaskr.blog import get_feed_page
+from flaskr.db import get_write_db
+from flaskr.jobs import Worker
+
+# user ids, in the order the users register
+AUTHOR, READER, OTHER = 1, 2, 3
+
+
+@pytest.fixture
+def config():
+    return {'FEED_BACKFILL': 2, 'POSTS_PER_PAGE': 2}
+
+
+@pytest.fixture
+def users(app):
+    clients = {}
+    for name in ('author', 'reader', 'other'):
+        client = clients[name] = app.test_client()
+        data = {'username': name, 'password': 'test'}
+        client.post('/auth/register', data=data)
+        client.post('/auth/login', data=data)
+    return clients
+
+
+def post(client, title):
+    client.post('/create', data={'title': title, 'body': 'Hello.'})
+
+
+def feed(app, user_id, before=None, after=None):
+    with app.test_request_context():
+        page = get_feed_page(user_id, before, after)
+        return [row['title'] for row in page], page
+
+
+def entries(app, user_id):
+    with app.app_context():
+        return [row[0] for row in get_write_db().execute(
+            'SELECT post_id FROM feed_entry WHERE user_id = ? ORDER BY 1',
+            (user_id,)
+        )]
+
+
+def test_fan_out_on_write(app, users):
+    users['reader'].post('/user/author/follow')
+    post(users['author'], 'first')
+
+    assert entries(app, READER) == [1]
+    assert entries(app, OTHER) == []
+    assert b'first' in users['reader'].get('/feed').data
+
+
+def test_backfill_on_follow(app, users):
+    for title in ('a', 'b', 'c'):
+        post(users['author'], title)
+    users['reader'].post('/user/author/follow')
+
+    assert entries(app, READER) == [2, 3]
+    assert feed(app, READER)[0] == ['c', 'b']
+
+
+def test_pages(app, users):
+    users['reader'].post('/user/author/follow')
+    for title in ('a', 'b', 'c'):
+        post(users['author'], title)
+
+    titles, first = feed(app, READER)
+    assert titles == ['c', 'b']
+    titles, second = feed(app, READER, before=first.next_cursor)
+    assert titles == ['a']
+    assert second.next_cursor is None
+    assert feed(app, READER, after=second.prev_cursor)[0] == ['c', 'b']
+
+
+def test_unfollow(app, users):
+    users['reader'].post('/user/author/follow')
+    post(users['author'], 'first')
+    users['reader'].post('/user/author/unfollow')
+
+    assert entries(app, READER) == []
+    assert feed(app, READER)[0] == []
+
+
+def test_delete(app, users):
+    users['reader'].post('/user/author/follow')
+    post(users['author'], 'first')
+    users['author'].post('/1/delete')
+
+    assert entries(app, READER) == []
+    assert feed(app, READER)[0] == []
+
+
+@pytest.mark.parametrize('config', [{'FEED_FANOUT_JOBS': True}])
+def test_fan_out_by_worker(app, users):
+    users['reader'].post('/user/author/follow')
+    post(users['author'], 'first')
+    assert entries(app, READER) == []
+
+    Worker(app, workers=1).run(once=True)
+    assert entries(app, READER) == [1]
+
+
+@pytest.mark.parametrize('config', [{
+    'FEED_FANOUT_LIMIT': 1, 'FEED_BACKFILL': 2, 'POSTS_PER_PAGE': 2,
+}])
+def test_pull_past_fan_out_limit(app, users):
+    users['reader'].post('/user/author/follow')
+    post(users['author'], 'a')
+    post(users['other'], 'mine')
+    users['reader'].post('/user/other/follow')
+    # a second follower takes the author past the limit
+    users['other'].post('/user/author/follow')
+    post(users['author'], 'b')
+    post(users['author'], 'c')
+
+    with app.app_context():
+        assert get_write_db().execute(
+            'SELECT pull FROM follow_count WHERE author_id = ?', (AUTHOR,)
+        ).fetchone()[0] == 1
+    # the entries written before are still there, but shown only once
+    assert entries(app, READER) == [1, 2]
+    assert entries(app, OTHER) == [1]
+
+    titles, first = feed(app, READER)
+    assert titles == ['c', 'b']
+    titles, second = feed(app, READER, before=first.next_cursor)
+    assert titles == ['mine', 'a']
+    assert feed(app, READER, after=second.prev_cursor)[0] == ['c', 'b']
+    assert feed(app, OTHER)[0] == ['c', 'b']
+
+    # followers of a pulled author get no backfill either
+    users['other'].post('/user/author/unfollow')
+    users['other'].post('/user/author/follow')
+    assert entries(app, OTHER) == []
+    assert feed(app, OTHER)[0] == ['c', 'b']
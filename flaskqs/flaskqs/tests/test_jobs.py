@@ -0,0 +1,146 @@
+import pytest
+
+from flaskr import jobs
+from flaskr.db import get_write_db
+from flaskr.jobs import Worker, enqueue, job
+
+calls = []
+
+
+@job('test-record')
+def record(*args):
+    calls.append(args)
+
+
+@job('test-fail')
+def fail():
+    calls.append(())
+    raise RuntimeError('Failed.')
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs, 'time', clock)
+    calls.clear()
+    return clock
+
+
+@pytest.fixture
+def config():
+    return {'JOB_RETRY_DELAY': 10, 'JOB_MAX_ATTEMPTS': 3, 'JOB_TIMEOUT': 60}
+
+
+def queued(app):
+    with app.app_context():
+        return [tuple(row) for row in get_write_db().execute(
+            'SELECT name, state, attempts, run_at FROM job ORDER BY id'
+        )]
+
+
+def run(app):
+    worker = Worker(app, workers=2)
+    worker.run(once=True)
+    return worker
+
+
+def test_enqueue_and_run(app, clock):
+    with app.app_context():
+        enqueue('test-record', 1, 'a')
+        enqueue('test-record', 2, 'b', delay=30)
+        with pytest.raises(ValueError):
+            enqueue('no-such-job')
+
+    worker = run(app)
+    assert calls == [(1, 'a')]
+    assert worker.done == 1
+    # done jobs are deleted, later ones wait
+    assert queued(app) == [('test-record', 'queued', 0, 1030.0)]
+
+    clock.now += 30
+    run(app)
+    assert calls == [(1, 'a'), (2, 'b')]
+    assert queued(app) == []
+
+
+def test_retry_with_backoff_then_fail(app, clock):
+    with app.app_context():
+        enqueue('test-fail')
+
+    worker = run(app)
+    assert worker.retried == 1
+    assert queued(app) == [('test-fail', 'queued', 1, 1010.0)]
+
+    clock.now += 10
+    run(app)
+    assert queued(app) == [('test-fail', 'queued', 2, 1030.0)]
+
+    clock.now += 20
+    worker = run(app)
+    assert worker.failed == 1
+    assert queued(app) == [('test-fail', 'failed', 3, 1030.0)]
+
+    clock.now += 1000
+    run(app)
+    assert len(calls) == 3
+
+
+def test_claimed_once(app, clock):
+    with app.app_context():
+        enqueue('test-record', 1)
+        db = get_write_db()
+        worker = Worker(app)
+        assert len(worker.claim(db, 10)) == 1
+        assert worker.claim(db, 10) == []
+
+
+def test_timed_out_job_runs_again(app, clock):
+    with app.app_context():
+        enqueue('test-record', 1)
+        # as if the worker that claimed it died
+        Worker(app).claim(get_write_db(), 1)
+
+    run(app)
+    assert calls == []
+
+    clock.now += 60
+    run(app)
+    assert calls == [(1,)]
+    assert queued(app) == []
+
+
+def test_timed_out_past_attempts(app, clock):
+    with app.app_context():
+        enqueue('test-record', 1)
+        for _ in range(3):
+            Worker(app).claim(get_write_db(), 1)
+            clock.now += 60
+
+    run(app)
+    assert calls == []
+    assert queued(app) == [('test-record', 'failed', 3, 1180.0)]
+
+
+def test_worker_command(app, runner, clock, monkeypatch):
+    # leave pytest's own handlers be
+    monkeypatch.setattr(jobs.signal, 'signal', lambda *args: None)
+
+    with app.app_context():
+        enqueue('test-record', 1)
+        enqueue('test-fail')
+        result = runner.invoke(args=['worker', '--workers', '1', '--once'])
+
+    assert 'Running jobs on 1 threads.' in result.output
+    assert 'queued 1, running 0, failed 0' in result.output
+    assert calls == [(1,), ()]
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from flaskr.db import get_read_db
+
+# ten rows, the first read by execute() and the rest as they're fetched
+SLOW_SELECT = (
+    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n'
+    ' WHERE i < 10) SELECT nap(i) FROM n'
+)
+
+
+def nap(i):
+    time.sleep(0.02)
+    return i
+
+
+@pytest.mark.parametrize('read', (
+    lambda cursor: cursor.fetchall(),
+    lambda cursor: list(cursor),
+    lambda cursor: [cursor.fetchone() for _ in range(11)],
+))
+def test_slow_select_is_logged(app, caplog, read):
+    with app.app_context():
+        db = get_read_db()
+        db.create_function('nap', 1, nap)
+        read(db.execute(SLOW_SELECT))
+
+    assert 'Slow query' in caplog.text
+    assert 'nap(i)' in caplog.text
+
+
+def test_fast_select_is_not_logged(app, caplog):
+    with app.app_context():
+        get_read_db().execute('SELECT * FROM user').fetchall()
+
+    assert 'Slow query' not in caplog.text
+
+
+def test_unfinished_select_is_logged_when_dropped(app, caplog):
+    with app.app_context():
+        db = get_read_db()
+        db.create_function('nap', 1, nap)
+        cursor = db.execute(SLOW_SELECT)
+        cursor.fetchmany(9)
+        assert 'Slow query' not in caplog.text
+        del cursor
+
+    assert 'Slow query' in caplog.text
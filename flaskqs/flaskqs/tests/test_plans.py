@@ -0,0 +1,43 @@
+from flaskr.plans import (
+    Statement, check_query_plans, collect_statements, report, seeded_database
+)
+
+
+def test_no_full_scans(app):
+    with app.app_context():
+        db = seeded_database()
+        plans = check_query_plans(db)
+        db.close()
+
+    assert len(plans) == len(collect_statements())
+    failed = [plan for plan in plans if plan.scans]
+    assert not failed, report(failed)
+
+
+def test_full_scan_is_caught(app):
+    statement = Statement('test', 1, 'SELECT id FROM post WHERE body = ?')
+
+    with app.app_context():
+        db = seeded_database()
+        (plan,) = check_query_plans(db, [statement])
+        db.close()
+
+    assert plan.scans == ['SCAN post']
+
+
+def test_command(app, runner):
+    # flask pushes the app context for commands, the test runner doesn't
+    with app.app_context():
+        result = runner.invoke(args=['check-query-plans'])
+
+    assert result.exit_code == 0
+    assert '0 full scans' in result.output
+
+
+def test_not_logged_as_slow(app, runner, caplog):
+    app.config['SLOW_QUERY_MS'] = 0
+
+    with app.app_context():
+        runner.invoke(args=['check-query-plans'])
+
+    assert 'Slow query' not in caplog.text
@@ -0,0 +1,120 @@
+import pytest
+
+from flaskr import create_app, ratelimit
+from flaskr.ratelimit import MemoryBuckets, SQLiteBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path, clock):
+    if request.param == 'memory':
+        return MemoryBuckets(shards=1, evict_interval=10)
+    return SQLiteBuckets(str(tmp_path / 'limits.sqlite'), evict_interval=10)
+
+
+def test_burst_then_one_per_interval(buckets, clock):
+    assert [buckets.take('a', 3, 2.0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('a', 3, 2.0) == pytest.approx(2.0)
+    # other buckets are untouched
+    assert buckets.take('b', 3, 2.0) == 0
+
+    clock.now += 1.5
+    assert buckets.take('a', 3, 2.0) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.take('a', 3, 2.0) == 0
+    assert buckets.take('a', 3, 2.0) == pytest.approx(2.0)
+
+
+def test_full_buckets_evicted(buckets, clock):
+    buckets.take('a', 3, 2.0)
+    buckets.take('b', 3, 20.0)
+    assert len(buckets) == 2
+
+    clock.now += 10
+    buckets.take('c', 3, 2.0)
+    assert len(buckets) == 2
+    assert buckets.evictions == 1
+
+
+@pytest.fixture
+def config():
+    return {
+        'AUTH_RATE_LIMIT_IP': (3, 60.0),
+        'AUTH_RATE_LIMIT_USERNAME': (2, 60.0),
+    }
+
+
+def login(client, username, ip='10.0.0.1'):
+    return client.post(
+        '/auth/login', data={'username': username, 'password': 'x'},
+        environ_base={'REMOTE_ADDR': ip}
+    )
+
+
+def test_too_many_attempts(client, clock):
+    assert login(client, 'a').status_code == 200
+    assert login(client, 'a').status_code == 200
+
+    response = login(client, 'a')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
+
+    clock.now += 60
+    assert login(client, 'a').status_code == 200
+
+
+def test_limits_per_username_and_ip(app, client, clock):
+    login(client, 'a')
+    login(client, 'a')
+    # another username from the same IP gets through, until the IP's
+    # bucket is empty
+    assert login(client, 'b').status_code == 200
+    assert login(client, 'c').status_code == 429
+    # another IP still can't try the same username
+    assert login(client, 'a', '10.0.0.2').status_code == 429
+    assert login(client, 'c', '10.0.0.2').status_code == 200
+
+    limiter = app.extensions['flaskr_rate_limiter']
+    assert limiter.rejected == {'ip': 1, 'username': 1}
+
+
+def test_get_not_limited(client, clock):
+    for _ in range(5):
+        assert client.get('/auth/login').status_code == 200
+
+
+@pytest.mark.parametrize('config', [{
+    'AUTH_RATE_LIMIT_IP': None,
+    'AUTH_RATE_LIMIT_USERNAME': None,
+}])
+def test_disabled(client, clock):
+    for _ in range(5):
+        assert login(client, 'a').status_code == 200
+
+
+def test_shared_between_workers(app, tmp_path, clock):
+    app.config['AUTH_RATE_LIMIT_DATABASE'] = str(tmp_path / 'limits.sqlite')
+    # as another worker process would be
+    other = create_app(app.config)
+    other.jinja_loader = app.jinja_loader
+
+    assert login(app.test_client(), 'a').status_code == 200
+    assert login(other.test_client(), 'a').status_code == 200
+    assert login(app.test_client(), 'a').status_code == 429
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+
+from flaskr.archive import archive_posts
+from flaskr.db import get_write_db
+from flaskr.render import RENDER_VERSION, render_markdown, rerender_posts
+
+
+@pytest.mark.parametrize(('body', 'html'), [
+    ('<script>alert(1)</script>',
+     '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>'),
+    ('<img src=x onerror=alert(1)>',
+     '<p>&lt;img src=x onerror=alert(1)&gt;</p>'),
+    ('# <b>title</b>', '<h1>&lt;b&gt;title&lt;/b&gt;</h1>'),
+    ('- *<i>*', '<ul><li><em>&lt;i&gt;</em></li></ul>'),
+    ('`<b>` **<b>**',
+     '<p><code>&lt;b&gt;</code> <strong>&lt;b&gt;</strong></p>'),
+    ('```\n</pre><script>\n```',
+     '<pre><code>&lt;/pre&gt;&lt;script&gt;</code></pre>'),
+])
+def test_raw_html_escaped(body, html):
+    assert render_markdown(body) == html
+
+
+@pytest.mark.parametrize('url', [
+    'javascript:alert(1)',
+    'JavaScript:alert(1)',
+    'data:text/html,<script>alert(1)</script>',
+    'vbscript:msgbox(1)',
+    '&#106;avascript:alert(1)',
+])
+def test_unsafe_link_left_as_text(url):
+    html = render_markdown(f'[click]({url})')
+
+    assert '<a' not in html
+    assert html.startswith('<p>[click](')
+
+
+def test_safe_links():
+    assert render_markdown('[a](https://example.com/?q=1&r=2)') == (
+        '<p><a href="https://example.com/?q=1&amp;r=2" rel="nofollow">a</a>'
+        '</p>'
+    )
+    assert '<a href="/1"' in render_markdown('[a](/1)')
+    assert '<a href="mailto:a@example.com"' in render_markdown(
+        '[a](mailto:a@example.com)'
+    )
+
+
+@pytest.mark.parametrize('url', [
+    'https://example.com/"onmouseover="alert(1)',
+    "https://example.com/'onmouseover='alert(1)",
+    'https://example.com/"><script>alert(1)</script>',
+])
+def test_link_attribute_injection(url):
+    html = render_markdown(f'[a]({url})')
+
+    assert html.count('"') == 4
+    assert '<script' not in html
+    assert "'" not in html
+
+
+def test_label_escaped():
+    assert render_markdown('[<b>a</b>](/1)') == (
+        '<p><a href="/1" rel="nofollow">&lt;b&gt;a&lt;/b&gt;</a></p>'
+    )
+
+
+def test_rendered_on_create_and_edit(client, auth):
+    auth.register()
+    auth.login()
+    client.post('/create', data={'title': 't', 'body': '*a* <b>'})
+    assert b'<em>a</em> &lt;b&gt;' in client.get('/1').data
+
+    client.post('/1/update', data={'title': 't', 'body': '**b** <i>'})
+    page = client.get('/1').data
+    assert b'<strong>b</strong> &lt;i&gt;' in page
+    assert b'<em>a</em>' not in page
+
+
+def test_rerender_stale_posts(app, client, auth):
+    # the second post is archived, so its HTML goes to post_archive
+    auth.register()
+    auth.login()
+    client.post('/create', data={'title': 'new', 'body': '*a*'})
+    client.post('/create', data={'title': 'old', 'body': '*b*'})
+
+    with app.app_context():
+        db = get_write_db()
+        db.execute("UPDATE post SET body_html = '', render_version = 0")
+        db.execute("UPDATE post SET created = '2000-01-01' WHERE id = 2")
+        db.commit()
+        assert archive_posts(datetime(2001, 1, 1)) == 1
+        assert rerender_posts(workers=0) == 2
+
+        rows = db.execute(
+            'SELECT body_html, render_version FROM post_full ORDER BY id'
+        ).fetchall()
+        assert [tuple(row) for row in rows] == [
+            ('<p><em>a</em></p>', RENDER_VERSION),
+            ('<p><em>b</em></p>', RENDER_VERSION),
+        ]
+        # nothing left to do
+        assert rerender_posts(workers=0) == 0
@@ -0,0 +1,49 @@
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from flaskr.serve import WorkerServer
+
+
+@pytest.fixture
+def servers(app):
+    @app.route('/sleep')
+    def sleep():
+        time.sleep(1.0)
+        return 'Slept.'
+
+    sock = socket.create_server(('127.0.0.1', 0))
+    # two workers of one thread each, sharing the socket
+    servers = [WorkerServer(app, sock, 1, 0, True) for _ in range(2)]
+    threads = [threading.Thread(target=server.run) for server in servers]
+    for thread in threads:
+        thread.start()
+
+    yield f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+    for server in servers:
+        server.shutdown()
+    for thread in threads:
+        thread.join()
+    sock.close()
+
+
+def get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def test_busy_worker_leaves_connections_to_idle_one(servers):
+    slow = threading.Thread(target=get, args=(f'{servers}/sleep',))
+    slow.start()
+    time.sleep(0.1)
+
+    waits = [get(f'{servers}/hello') for _ in range(5)]
+    slow.join()
+
+    assert max(waits) < 0.5
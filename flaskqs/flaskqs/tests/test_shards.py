@@ -0,0 +1,110 @@
+import pytest
+
+from flaskr.blog import get_page
+from flaskr.db import get_write_db
+from flaskr.shards import reshard
+
+
+@pytest.fixture
+def config():
+    return {'SHARDS': 2, 'POSTS_PER_PAGE': 2}
+
+
+@pytest.fixture
+def users(app):
+    # one, id 1, gets shard 1, two shard 0; three never posts
+    clients = {}
+    for name in ('one', 'two', 'three'):
+        client = clients[name] = app.test_client()
+        data = {'username': name, 'password': 'test'}
+        client.post('/auth/register', data=data)
+        client.post('/auth/login', data=data)
+    return clients
+
+
+def post(client, title):
+    client.post('/create', data={'title': title, 'body': 'Hello.'})
+
+
+def post_ids(app, shard):
+    with app.app_context():
+        return [row[0] for row in get_write_db(shard).execute(
+            'SELECT id FROM post ORDER BY id'
+        )]
+
+
+def test_posts_on_author_shard(app, users):
+    post(users['one'], 'a')
+    post(users['two'], 'b')
+    post(users['one'], 'c')
+
+    assert post_ids(app, 1) == [1, 3]
+    assert post_ids(app, 0) == [2]
+    assert post_ids(app, None) == []
+    with app.app_context():
+        assert [tuple(row) for row in get_write_db().execute(
+            'SELECT id, author_id FROM post_route ORDER BY id'
+        )] == [(1, 1), (2, 2), (3, 1)]
+
+    assert b'<h1>b</h1>' in users['one'].get('/2').data
+    users['two'].post('/2/update', data={'title': 'd', 'body': 'Hi.'})
+    assert b'<h1>d</h1>' in users['one'].get('/2').data
+
+    users['two'].post('/2/delete')
+    assert post_ids(app, 0) == []
+    assert users['one'].get('/2').status_code == 404
+    with app.app_context():
+        assert get_write_db().execute(
+            'SELECT id FROM post_route WHERE id = 2'
+        ).fetchone() is None
+
+
+def test_index_merges_shards(app, users):
+    for title in ('a', 'b', 'c', 'd', 'e'):
+        post(users['one' if title in 'ace' else 'two'], title)
+
+    pages = []
+    with app.test_request_context():
+        page = get_page()
+        while True:
+            pages.append([post['title'] for post in page])
+            if page.next_cursor is None:
+                break
+            page = get_page(before=page.next_cursor)
+
+        assert pages == [['e', 'd'], ['c', 'b'], ['a']]
+        assert [post['title'] for post in get_page(
+            after=page.prev_cursor
+        )] == ['c', 'b']
+
+
+def test_author_without_shard(app, users):
+    post(users['one'], 'a')
+
+    response = users['one'].get('/user/three')
+    assert response.status_code == 200
+    assert b'0 posts' in response.data
+
+    users['one'].post('/user/three/follow')
+    assert b'1 follower' in users['one'].get('/user/three').data
+    assert b'>a</a></h1>' in users['two'].get('/user/one').data
+
+
+def test_reshard(app, users):
+    for title in ('a', 'b', 'c'):
+        post(users['one' if title in 'ac' else 'two'], title)
+
+    with app.app_context():
+        assert reshard(0) == 3
+    app.config['SHARDS'] = 0
+    assert post_ids(app, None) == [1, 2, 3]
+    assert b'<h1>b</h1>' in users['one'].get('/2').data
+
+    with app.app_context():
+        assert reshard(3) == 3
+    app.config['SHARDS'] = 3
+    moved = [post_ids(app, shard) for shard in range(3)]
+    assert sorted(sum(moved, [])) == [1, 2, 3]
+    post(users['two'], 'd')
+    # the ids go on from where they were
+    assert b'<h1>d</h1>' in users['one'].get('/4').data
@@ -0,0 +1,78 @@
+import io
+
+import pytest
+
+from flaskr.db import get_write_db
+from flaskr.transfer import (
+    POST_FIELDS, import_posts, load_posts, read_rows, write_rows
+)
+
+
+@pytest.fixture
+def author(app):
+    with app.app_context():
+        db = get_write_db()
+        db.execute("INSERT INTO user (username, password) VALUES ('a', 'x')")
+        db.commit()
+
+
+def check_maintained(db, posts):
+    # the search index matches post_full, and the stats and HTML are there
+    db.execute("INSERT INTO post_fts (post_fts) VALUES ('integrity-check')")
+    assert db.execute(
+        "SELECT COUNT(*) FROM post_fts WHERE post_fts MATCH 'hello'"
+    ).fetchone()[0] == posts
+    assert db.execute(
+        'SELECT post_count FROM user_stats WHERE user_id = 1'
+    ).fetchone()[0] == posts
+    assert db.execute(
+        "SELECT COUNT(*) FROM post WHERE body_html = '<p>Hello.</p>'"
+    ).fetchone()[0] == posts
+
+
+def test_load(app, author):
+    with app.app_context():
+        rows = [(1, None, f'post {n}', 'Hello.') for n in range(5)]
+        assert load_posts(rows, batch_size=2) == 5
+        check_maintained(get_write_db(), 5)
+
+
+def test_load_fails_partway(app, author):
+    def rows():
+        for n in range(3):
+            yield (1, None, f'post {n}', 'Hello.')
+        raise ValueError('Bad row.')
+
+    with app.app_context():
+        with pytest.raises(ValueError):
+            load_posts(rows(), batch_size=2)
+
+        db = get_write_db()
+        # the first batch was committed, the second rolled back
+        check_maintained(db, 2)
+        # and the triggers are back
+        db.execute(
+            'INSERT INTO post (author_id, title, body)'
+            " VALUES (1, 't', 'hello')"
+        )
+        db.commit()
+        assert db.execute(
+            'SELECT post_count FROM user_stats WHERE user_id = 1'
+        ).fetchone()[0] == 3
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'csv'])
+def test_round_trip(app, author, fmt):
+    with app.app_context():
+        load_posts([(1, '2024-01-01 00:00:00', 'first', 'Hello.')])
+        db = get_write_db()
+        output = io.StringIO()
+        rows = db.execute(
+            'SELECT p.id, username, created, title, body FROM post p'
+            ' JOIN user u ON u.id = p.author_id'
+        )
+        assert write_rows(rows, POST_FIELDS, output, fmt) == 1
+
+        output.seek(0)
+        assert import_posts(read_rows(output, fmt)) == (1, 0)
+        check_maintained(db, 2)
@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from flaskr.db import ConnectionPool, PoolTimeout
+from flaskr.writer import GroupCommitWriter, WriterStopped
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'writer.sqlite')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE t (x)')
+    db.close()
+    return path
+
+
+def test_write(database):
+    writer = GroupCommitWriter(ConnectionPool(database))
+    assert writer.execute('INSERT INTO t VALUES (1)').rowcount == 1
+    writer.close()
+
+
+def test_timeout(database):
+    writer = GroupCommitWriter(ConnectionPool(database), timeout=0.5)
+    writer.execute('INSERT INTO t VALUES (1)')
+    lock = sqlite3.connect(database, isolation_level=None)
+    lock.execute('BEGIN IMMEDIATE')
+    timeouts = []
+
+    def write():
+        try:
+            writer.execute('INSERT INTO t VALUES (2)')
+        except PoolTimeout:
+            timeouts.append(2)
+
+    # the writer waits for the lock with this write...
+    blocked = threading.Thread(target=write)
+    blocked.start()
+    time.sleep(0.1)
+
+    # ...so this one times out in the queue
+    with pytest.raises(PoolTimeout):
+        writer.execute('INSERT INTO t VALUES (3)')
+
+    lock.execute('COMMIT')
+    blocked.join()
+    writer.close()
+    # the write the writer had taken up is committed all the same, the
+    # other one is dropped
+    assert timeouts == [2]
+    assert lock.execute('SELECT x FROM t').fetchall() == [(1,), (2,)]
+
+
+@pytest.mark.filterwarnings(
+    'ignore::pytest.PytestUnhandledThreadExceptionWarning'
+)
+def test_stopped(tmp_path):
+    writer = GroupCommitWriter(
+        ConnectionPool(str(tmp_path / 'missing' / 'writer.sqlite'))
+    )
+
+    with pytest.raises(WriterStopped):
+        writer.execute('INSERT INTO t VALUES (1)')
+
+    # let it raise while the warning is filtered
+    for thread in threading.enumerate():
+        if thread.name == 'flaskr-writer':
+            thread.join()
+
+
+def test_shard_write_leaves_primary_unlocked(database, tmp_path):
+    shard = str(tmp_path / 'shard.sqlite')
+    db = sqlite3.connect(shard)
+    db.execute('CREATE TABLE t (x)')
+    db.close()
+    writer = GroupCommitWriter(
+        ConnectionPool(shard, attach=database), timeout=1.0
+    )
+    # another shard's writer, say, holding the primary's lock
+    lock = sqlite3.connect(database, isolation_level=None)
+    lock.execute('BEGIN IMMEDIATE')
+
+    assert writer.execute('INSERT INTO t VALUES (1)').rowcount == 1
+
+    lock.execute('COMMIT')
+    writer.close()